@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+Native messaging 的負載測試：像 Chrome 一樣啟動 teams_chat_host.py，
+送出含 N 個虛擬 issue 的 createSelectedChats frame，後端為本機的 mock Graph server。
+
+每次量測記錄：
+- startup:  啟動程序到收到 ping 回應的時間
+- warmup:   warmup 動作（取得 token、建立 Graph 連線）的時間（--warmup）
+- encode/decode: 請求與回應 frame 的 JSON 編解碼時間與大小（framing 成本）
+- first:    送出請求到收到第一個 progress frame 的時間（--stream）
+- e2e:      送出請求到收到最後回應的時間
+
+用法: python bench/bench_host_load.py [--sizes 1,10,100] [--runs 3] [--latency 0.05] [--stream] [--daemon] [--warmup]
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(bench_dir)
+host_dir = os.path.join(root_dir, 'host')
+sys.path.append(host_dir)
+
+from mock_graph import MockGraphServer
+from native_messaging import MAX_INCOMING_SIZE, MessageCodec, is_progress_frame
+
+HOST_SCRIPT = os.path.join(host_dir, 'teams_chat_host.py')
+
+
+def host_env(graph_url, work_dir, use_daemon):
+    env = dict(os.environ)
+    env.update({
+        'TEAMS_CHAT_GRAPH_ROOT': graph_url,
+        'TEAMS_CHAT_ACCESS_TOKEN': 'mock-token',
+        'TEAMS_CHAT_STATE_DB': os.path.join(work_dir, 'state.db'),
+        'TEAMS_CHAT_USER_CACHE': os.path.join(work_dir, 'users.json'),
+        'TEAMS_CHAT_LOG_FILE': os.path.join(work_dir, 'host.log'),
+        'TEAMS_CHAT_TRACE_FILE': 'off',
+        'TEAMS_CHAT_DAEMON': 'on' if use_daemon else 'off',
+        'TEAMS_CHAT_DAEMON_IDLE': '60'
+    })
+    return env
+
+
+def stop_daemon():
+    """結束量測時啟動的常駐程式，避免它帶著 mock 設定繼續服務 Chrome"""
+    import teams_chat_daemon
+    try:
+        with open(teams_chat_daemon.ENDPOINT_FILE, 'r', encoding='utf-8') as f:
+            os.kill(json.load(f)['pid'], signal.SIGTERM)
+    except (OSError, ValueError, KeyError):
+        pass
+
+
+def make_request(run_id, count, stream):
+    issues = [
+        {
+            'title': f'[LOAD-{run_id}-{i}] Load test issue {i}',
+            'link': f'https://jira.example.com/browse/LOAD-{run_id}-{i}',
+            'key': f'LOAD-{run_id}-{i}',
+            'assignee': f'Assignee {i % 5}',
+            'assigneeEmail': f'assignee{i % 5}@example.com'
+        }
+        for i in range(count)
+    ]
+    return {
+        'action': 'createSelectedChats',
+        'selectedIssues': issues,
+        'ownerEmail': 'owner@example.com',
+        'memberEmails': ['member0@example.com', 'member1@example.com'],
+        'stream': stream
+    }
+
+
+def run_once(env, request, warmup=False):
+    """啟動一個 host 程序，先 ping（以及 warmup）再送出請求，回傳各項時間（秒）與回應"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, HOST_SCRIPT],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=env
+    )
+    codec = MessageCodec(process.stdout, process.stdin, max_outgoing=MAX_INCOMING_SIZE)
+    try:
+        codec.write({'action': 'ping'})
+        codec.read()
+        startup = time.perf_counter() - started
+
+        warmed = None
+        if warmup:
+            warmup_started = time.perf_counter()
+            codec.write({'action': 'warmup'})
+            codec.read()
+            warmed = time.perf_counter() - warmup_started
+
+        encode_started = time.perf_counter()
+        payload = json.dumps(request).encode('utf-8')
+        encode = time.perf_counter() - encode_started
+
+        sent = time.perf_counter()
+        codec.write_raw(payload)
+        first = None
+        decode = 0.0
+        response_bytes = 0
+        while True:
+            raw = codec.read_raw()
+            if raw is None:
+                raise RuntimeError('Host closed the connection before responding')
+            received = time.perf_counter()
+            message = json.loads(raw.decode('utf-8'))
+            decode += time.perf_counter() - received
+            response_bytes += len(raw) + 4
+            if first is None:
+                first = received - sent
+            if not is_progress_frame(message):
+                break
+        e2e = time.perf_counter() - sent
+    finally:
+        process.stdin.close()
+        process.wait()
+
+    return {
+        'startup': startup,
+        'warmup': warmed,
+        'encode': encode,
+        'decode': decode,
+        'request_bytes': len(payload) + 4,
+        'response_bytes': response_bytes,
+        'first': first,
+        'e2e': e2e,
+        'ok': len(message.get('result') or []) if message.get('success') else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Native messaging load driver for teams_chat_host.py')
+    parser.add_argument('--sizes', default='1,10,100')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.05, help='mock latency per request (s)')
+    parser.add_argument('--throttle', type=float, default=0.0)
+    parser.add_argument('--provisioning', type=float, default=0.0)
+    parser.add_argument('--stream', action='store_true', help='request progress frames')
+    parser.add_argument('--daemon', action='store_true', help='let the host forward to the background daemon')
+    parser.add_argument('--warmup', action='store_true', help='send a warmup message before each request')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+
+    if args.daemon:
+        import teams_chat_daemon
+        connection = teams_chat_daemon.connect()
+        if connection is not None:
+            # 已在執行的常駐程式使用正式的 Graph 與 token，不能拿來做負載測試
+            connection.close()
+            sys.exit('A teams_chat_daemon is already running; stop it before using --daemon')
+
+    with tempfile.TemporaryDirectory() as work_dir, MockGraphServer(
+        latency=args.latency,
+        throttle_rate=args.throttle,
+        provisioning_delay=args.provisioning,
+        retry_after=0,
+        seed=1
+    ) as server:
+        env = host_env(server.url, work_dir, args.daemon)
+        print(f'Mock Graph: {server.url} latency={args.latency}s stream={args.stream} '
+              f'daemon={args.daemon} warmup={args.warmup}')
+        print(f'{"issues":>7}{"ok":>6}{"startup ms":>12}{"warmup ms":>11}{"encode ms":>11}{"decode ms":>11}'
+              f'{"req KB":>9}{"resp KB":>9}{"first ms":>10}{"e2e ms":>10}{"chats/min":>11}')
+
+        run_id = int(time.time())
+        for size in sizes:
+            samples = [
+                run_once(env, make_request(f'{run_id}-{size}-{run}', size, args.stream), args.warmup)
+                for run in range(args.runs)
+            ]
+
+            def median(key, scale=1000.0):
+                values = [sample[key] for sample in samples if sample[key] is not None]
+                return statistics.median(values) * scale if values else 0.0
+
+            e2e = median('e2e', 1.0)
+            ok = min(sample['ok'] for sample in samples)
+            print(f'{size:>7}{ok:>6}{median("startup"):>12.1f}{median("warmup"):>11.1f}{median("encode"):>11.2f}'
+                  f'{median("decode"):>11.2f}{median("request_bytes", 1 / 1024):>9.1f}'
+                  f'{median("response_bytes", 1 / 1024):>9.1f}{median("first"):>10.1f}'
+                  f'{e2e * 1000:>10.1f}{ok / e2e * 60 if e2e else 0:>11.1f}')
+
+        if args.daemon:
+            stop_daemon()
+        print(json.dumps(server.graph.stats()['requests']))
+
+
+if __name__ == '__main__':
+    main()
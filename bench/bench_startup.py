@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+比較 native host 在兩種模式下的啟動時間：
+
+- inprocess: TEAMS_CHAT_DAEMON=off，每個 host 程序自行載入 requests/msal
+- daemon:    host 只是轉送訊息的 shim，常駐程式已經載入所有模組
+
+每次量測都像 Chrome 一樣啟動一個新的 teams_chat_host.py，
+送出 ping（warm=True）並量測收到回應的時間。
+
+用法: python bench/bench_startup.py [--runs 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import struct
+import subprocess
+import sys
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(bench_dir)
+host_dir = os.path.join(root_dir, 'host')
+sys.path.append(host_dir)
+sys.path.append(root_dir)
+
+HOST_SCRIPT = os.path.join(host_dir, 'teams_chat_host.py')
+DAEMON_SCRIPT = os.path.join(host_dir, 'teams_chat_daemon.py')
+
+
+def ping_host(env):
+    """啟動一個 host 程序並送出 ping，回傳 (回應時間, 總時間, 回應)"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, HOST_SCRIPT],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=env
+    )
+    payload = json.dumps({'action': 'ping', 'warm': True}).encode('utf-8')
+    process.stdin.write(struct.pack('=I', len(payload)) + payload)
+    process.stdin.flush()
+
+    raw_length = process.stdout.read(4)
+    response = None
+    if len(raw_length) == 4:
+        length = struct.unpack('=I', raw_length)[0]
+        response = json.loads(process.stdout.read(length).decode('utf-8'))
+    replied = time.perf_counter()
+
+    process.stdin.close()
+    process.wait()
+    return replied - started, time.perf_counter() - started, response
+
+
+def wait_for_daemon(timeout=30.0):
+    import teams_chat_daemon
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        connection = teams_chat_daemon.connect()
+        if connection is not None:
+            connection.close()
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def summarize(name, samples):
+    reply_times = [s[0] * 1000 for s in samples]
+    total_times = [s[1] * 1000 for s in samples]
+    print(
+        f"{name:10s} reply median {statistics.median(reply_times):7.1f} ms "
+        f"(min {min(reply_times):7.1f}, max {max(reply_times):7.1f})  "
+        f"process total median {statistics.median(total_times):7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env['PYTHONIOENCODING'] = 'utf-8'
+
+    inprocess_env = dict(env, TEAMS_CHAT_DAEMON='off')
+    inprocess = [ping_host(inprocess_env) for _ in range(args.runs)]
+    print(f"inprocess response: {inprocess[-1][2]}")
+
+    daemon_process = None
+    import teams_chat_daemon
+    if teams_chat_daemon.connect() is None:
+        daemon_process = subprocess.Popen(
+            [sys.executable, DAEMON_SCRIPT],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        if not wait_for_daemon():
+            print("Daemon did not start")
+            daemon_process.terminate()
+            return 1
+
+    try:
+        daemon = [ping_host(env) for _ in range(args.runs)]
+        print(f"daemon response:    {daemon[-1][2]}")
+    finally:
+        if daemon_process is not None:
+            daemon_process.terminate()
+            daemon_process.wait()
+
+    summarize('inprocess', inprocess)
+    summarize('daemon', daemon)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+以本機的 mock Graph server 量測建立聊天的吞吐量與延遲。
+
+- single: 逐一呼叫 create_teams_chat.create_teams_chat_single
+- host:   以 teams_chat_host.handle_message 送出一個 createSelectedChats（併發建立）
+- group:  同 host，但加上 groupByAssignee（每個 assignee 一個聊天）
+
+TokenManager 以固定 token 的替身取代，不需要登入；狀態資料庫、使用者快取與日誌都寫到暫存目錄。
+
+用法: python bench/bench_throughput.py [--sizes 1,10,100] [--latency 0.05] [--throttle 0.02]
+                                        [--provisioning 0.5] [--concurrency 4] [--unlimited]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(bench_dir)
+sys.path.append(root_dir)
+sys.path.append(os.path.join(root_dir, 'host'))
+
+from mock_graph import MockGraphServer
+
+
+class StubTokenManager:
+    """固定回傳同一個 token 的 TokenManager 替身"""
+
+    def get_token(self):
+        return 'mock-token'
+
+
+def setup_environment(graph_url, work_dir):
+    """必須在載入 create_teams_chat 之前設定"""
+    os.environ['TEAMS_CHAT_GRAPH_ROOT'] = graph_url
+    os.environ['TEAMS_CHAT_STATE_DB'] = os.path.join(work_dir, 'state.db')
+    os.environ['TEAMS_CHAT_TRACE_FILE'] = 'off'
+    os.environ['TEAMS_CHAT_LOG_FILE'] = os.path.join(work_dir, 'host.log')
+    os.environ['TEAMS_CHAT_DAEMON'] = 'off'
+
+    import create_teams_chat
+    from rate_limiter import DEFAULT_RATES, RateLimiter
+    from user_cache import UserIdCache
+
+    create_teams_chat._token_manager = StubTokenManager()
+    create_teams_chat._user_cache = UserIdCache(path=os.path.join(work_dir, 'users.json'))
+    return create_teams_chat, DEFAULT_RATES, RateLimiter
+
+
+def make_issues(run_id, count):
+    return [
+        {
+            'title': f'[BENCH-{run_id}-{i}] Benchmark issue {i}',
+            'link': f'https://jira.example.com/browse/BENCH-{run_id}-{i}',
+            'key': f'BENCH-{run_id}-{i}',
+            'assignee': f'Assignee {i % 5}',
+            'assigneeEmail': f'assignee{i % 5}@example.com'
+        }
+        for i in range(count)
+    ]
+
+
+def run_single(create_teams_chat, issues, owner, members):
+    results = []
+    for issue in issues:
+        results.append(create_teams_chat.create_teams_chat_single(
+            issue['title'],
+            owner,
+            members + [issue['assigneeEmail']],
+            issue_link=issue['link'],
+            issue_key=issue['key'],
+            issue_title=issue['title'],
+            assignee=issue['assignee'],
+            assignee_email=issue['assigneeEmail']
+        ))
+    return sum(1 for result in results if result)
+
+
+def run_host(issues, owner, members, concurrency, group=False):
+    import teams_chat_host
+    response = teams_chat_host.handle_message({
+        'action': 'createSelectedChats',
+        'selectedIssues': issues,
+        'ownerEmail': owner,
+        'memberEmails': members,
+        'concurrency': concurrency,
+        'groupByAssignee': group
+    })
+    return len(response.get('result') or [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chat creation throughput against a mock Graph server')
+    parser.add_argument('--sizes', default='1,10,100', help='comma separated batch sizes')
+    parser.add_argument('--modes', default='single,host')
+    parser.add_argument('--latency', type=float, default=0.05, help='mock latency per request (s)')
+    parser.add_argument('--throttle', type=float, default=0.0, help='probability of a 429 per request')
+    parser.add_argument('--provisioning', type=float, default=0.0, help='seconds a new chat rejects messages')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--members', type=int, default=3)
+    parser.add_argument('--unlimited', action='store_true', help='disable the client-side rate limiter')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    modes = [mode for mode in args.modes.split(',') if mode]
+    owner = 'owner@example.com'
+    members = [f'member{i}@example.com' for i in range(args.members)]
+
+    with tempfile.TemporaryDirectory() as work_dir, MockGraphServer(
+        latency=args.latency,
+        throttle_rate=args.throttle,
+        provisioning_delay=args.provisioning,
+        retry_after=0,
+        seed=1
+    ) as server:
+        create_teams_chat, default_rates, RateLimiter = setup_environment(server.url, work_dir)
+        from metrics import metrics
+
+        print(f'Mock Graph: {server.url} latency={args.latency}s throttle={args.throttle} '
+              f'provisioning={args.provisioning}s concurrency={args.concurrency}')
+        print(f'{"mode":<8}{"issues":>8}{"ok":>6}{"secs":>9}{"chats/min":>11}'
+              f'{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"429s":>7}{"calls":>7}')
+
+        run_id = int(time.time())
+        for mode in modes:
+            for size in sizes:
+                # 每次量測使用新的速率限制器、統計與 issue key
+                rates = {name: 1e6 for name in default_rates} if args.unlimited else None
+                create_teams_chat.graph_client.rate_limiter = RateLimiter(rates)
+                metrics.reset()
+                throttled_before = server.graph.throttled
+                calls_before = sum(server.graph.stats()['requests'].values())
+                issues = make_issues(f'{run_id}-{mode}-{size}', size)
+
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if mode == 'single':
+                        ok = run_single(create_teams_chat, issues, owner, members)
+                    else:
+                        ok = run_host(issues, owner, members, args.concurrency, mode == 'group')
+                elapsed = time.perf_counter() - started
+                calls = sum(server.graph.stats()['requests'].values()) - calls_before
+
+                chat = metrics.snapshot().get('chat.total', {})
+                print(f'{mode:<8}{size:>8}{ok:>6}{elapsed:>9.2f}{ok / elapsed * 60:>11.1f}'
+                      f'{chat.get("p50_ms") or 0:>10.1f}{chat.get("p95_ms") or 0:>10.1f}'
+                      f'{chat.get("p99_ms") or 0:>10.1f}{server.graph.throttled - throttled_before:>7}{calls:>7}')
+
+        print(json.dumps(server.graph.stats()['requests']))
+
+
+if __name__ == '__main__':
+    main()
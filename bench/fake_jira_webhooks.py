@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+假的 JIRA webhook 發送端：對 jira_webhook_service 送出 N 個評論事件，量測事件驅動建立聊天的吞吐量。
+
+沒有指定 --url 時，在程序內啟動 mock Graph server 與 webhook 服務（固定 token，狀態寫到暫存目錄），
+送完後等待所有聊天建立完成並印出統計；指定 --url 時只對已在執行的服務送出事件。
+
+事件組成：每個 issue 一則指定用戶的新評論，另外混入
+- 非指定用戶的評論（應被篩選掉）
+- 超過時間範圍的評論（應被篩選掉）
+- 同一 issue 的重複事件（處理中時被忽略，之後由 ChatStore 重用）
+
+用法: python bench/fake_jira_webhooks.py [--issues 50] [--latency 0.05] [--concurrency 4] [--url URL]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(bench_dir)
+sys.path.append(root_dir)
+
+from mock_graph import MockGraphServer
+
+TARGET_USER = 'JIRAUSER50632'
+
+
+def jira_time(delta):
+    return (datetime.now(timezone.utc) - delta).strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+
+
+def comment_event(run_id, index, author=TARGET_USER, age=timedelta(minutes=5)):
+    key = f'HOOK-{run_id}-{index}'
+    return {
+        'timestamp': int(time.time() * 1000),
+        'webhookEvent': 'comment_created',
+        'issue': {
+            'key': key,
+            'fields': {
+                'summary': f'Webhook issue {index}',
+                'assignee': {
+                    'displayName': f'Assignee {index % 5}',
+                    'emailAddress': f'assignee{index % 5}@example.com'
+                }
+            }
+        },
+        'comment': {
+            'author': {'key': author, 'name': author},
+            'body': 'Please take a look',
+            'created': jira_time(age)
+        }
+    }
+
+
+def make_events(run_id, count):
+    events = [comment_event(run_id, i) for i in range(count)]
+    events += [comment_event(run_id, count + i, author='JIRAUSER00000') for i in range(count // 10)]
+    events += [comment_event(run_id, count * 2 + i, age=timedelta(hours=48)) for i in range(count // 10)]
+    events += [comment_event(run_id, i) for i in range(0, count, 5)]
+    return events
+
+
+def post(url, event, secret=None):
+    data = json.dumps(event).encode('utf-8')
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    if secret:
+        request.add_header('X-Webhook-Secret', secret)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read() or b'{}')
+    except urllib.error.HTTPError as e:
+        return e.code, {}
+
+
+def send_all(url, events, senders, secret=None):
+    """模擬 JIRA 同時送出事件，回傳 (各狀態碼數量, 花費秒數)"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=senders) as executor:
+        responses = list(executor.map(lambda event: post(url, event, secret), events))
+    elapsed = time.perf_counter() - started
+    statuses = {}
+    for status, _ in responses:
+        statuses[status] = statuses.get(status, 0) + 1
+    return statuses, elapsed
+
+
+def setup_environment(graph_url, work_dir):
+    """必須在載入 create_teams_chat 之前設定"""
+    os.environ['TEAMS_CHAT_GRAPH_ROOT'] = graph_url
+    os.environ['TEAMS_CHAT_ACCESS_TOKEN'] = 'mock-token'
+    os.environ['TEAMS_CHAT_STATE_DB'] = os.path.join(work_dir, 'state.db')
+    os.environ['TEAMS_CHAT_USER_CACHE'] = os.path.join(work_dir, 'users.json')
+    os.environ['TEAMS_CHAT_TRACE_FILE'] = 'off'
+
+
+def run_local(args, events):
+    with tempfile.TemporaryDirectory() as work_dir, MockGraphServer(
+        latency=args.latency,
+        throttle_rate=args.throttle,
+        retry_after=0,
+        seed=1
+    ) as graph:
+        setup_environment(graph.url, work_dir)
+        import contextlib
+        import io
+        from jira_webhook_service import WebhookServer, WebhookService
+
+        service = WebhookService(
+            'owner@example.com',
+            ['member0@example.com', 'member1@example.com'],
+            TARGET_USER,
+            comment_hours=18,
+            max_workers=args.concurrency
+        )
+        with WebhookServer(service, port=0, secret='bench-secret') as server, \
+                contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            statuses, send_elapsed = send_all(server.url, events, args.senders, 'bench-secret')
+            rejected, _ = send_all(server.url, events[:1], 1, 'wrong-secret')
+            finished = service.wait_idle(timeout=args.timeout)
+            elapsed = time.perf_counter() - started
+            service.close()
+
+        stats = service.stats()
+        print(f'Mock Graph: {graph.url} latency={args.latency}s concurrency={args.concurrency}')
+        print(f'events sent: {len(events)} in {send_elapsed:.2f}s, responses {statuses}, '
+              f'wrong secret {rejected}')
+        print(f'service: {json.dumps(stats)}')
+        created = stats.get('created', 0) + stats.get('reused', 0)
+        print(f'chats: {created} in {elapsed:.2f}s ({created / elapsed * 60:.1f} chats/min)'
+              f'{"" if finished else " (timed out waiting)"}')
+        print(json.dumps(graph.graph.stats()['requests']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake JIRA webhook sender for jira_webhook_service.py')
+    parser.add_argument('--issues', type=int, default=50)
+    parser.add_argument('--senders', type=int, default=4, help='concurrent webhook deliveries')
+    parser.add_argument('--latency', type=float, default=0.05, help='mock latency per request (s)')
+    parser.add_argument('--throttle', type=float, default=0.0)
+    parser.add_argument('--concurrency', type=int, default=4, help='service worker threads')
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--url', help='send to an already running service instead')
+    parser.add_argument('--secret', default=os.environ.get('TEAMS_CHAT_WEBHOOK_SECRET'))
+    args = parser.parse_args()
+
+    events = make_events(int(time.time()), args.issues)
+    if args.url:
+        statuses, elapsed = send_all(args.url, events, args.senders, args.secret)
+        print(f'events sent: {len(events)} in {elapsed:.2f}s, responses {statuses}')
+    else:
+        run_local(args, events)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+本機的 Microsoft Graph 替身，用於量測建立聊天的吞吐量，不需要連到正式環境。
+
+支援 create_teams_chat 使用的端點：
+    POST /{ver}/chats                               建立聊天
+    GET  /{ver}/chats                               列出聊天
+    POST/GET /{ver}/chats/{id}/members              加入/列出成員
+    POST /{ver}/chats/{id}/messages                 發送消息
+    POST /{ver}/chats/{id}/messages/{mid}/pin       釘選消息
+    GET  /{ver}/users/{email}                       解析使用者 ID
+    POST /{ver}/$batch                              批次（支援 dependsOn）
+
+可設定每個請求的延遲、429 注入機率，以及新聊天在多久內回傳 404（模擬佈建中）。
+email 含有 "unknown" 的使用者視為不存在。
+
+用法: python bench/mock_graph.py [--port 8765] [--latency 0.05] [--throttle 0.02] [--provisioning 0.5]
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+_CHAT_PATH = re.compile(r'^/chats/([^/]+)(/members|/messages(?:/([^/]+)/pin)?)?$')
+_USER_PATH = re.compile(r'^/users/([^/]+)$')
+
+
+class MockGraph:
+    """Graph 的狀態與路由（與 HTTP 無關，$batch 的子請求直接在程序內分派）"""
+
+    def __init__(self, latency=0.0, throttle_rate=0.0, provisioning_delay=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.provisioning_delay = provisioning_delay
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.chats = {}
+        self.requests = Counter()
+        self.throttled = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _throttle(self):
+        with self._lock:
+            if self.throttle_rate and self.random.random() < self.throttle_rate:
+                self.throttled += 1
+                return True
+        return False
+
+    def _throttled_response(self):
+        return 429, {'error': {'code': 'TooManyRequests', 'message': 'Throttled by mock'}}, \
+            {'Retry-After': str(self.retry_after)}
+
+    def dispatch(self, method, path, body):
+        """回傳 (status, body, headers)；path 不含版本前綴與查詢字串"""
+        if path == '/$batch' and method == 'POST':
+            self.requests['batch'] += 1
+            return 200, {'responses': self._batch(body.get('requests') or [])}, {}
+
+        if self._throttle():
+            return self._throttled_response()
+
+        if path == '/chats':
+            self.requests[f'{method} chats'] += 1
+            if method == 'POST':
+                return self._create_chat(body)
+            with self._lock:
+                chats = [self._public(chat) for chat in self.chats.values()]
+            return 200, {'value': chats}, {}
+
+        if path == '/me' and method == 'GET':
+            self.requests['GET me'] += 1
+            return 200, {'id': 'mock-owner'}, {}
+
+        match = _USER_PATH.match(path)
+        if match and method == 'GET':
+            self.requests['GET users'] += 1
+            email = unquote(match.group(1)).lower()
+            if 'unknown' in email:
+                return 404, {'error': {'code': 'Request_ResourceNotFound', 'message': f'{email} not found'}}, {}
+            return 200, {'id': str(uuid.UUID(hashlib.md5(email.encode('utf-8')).hexdigest()))}, {}
+
+        match = _CHAT_PATH.match(path)
+        if match:
+            chat_id, sub, message_id = match.groups()
+            with self._lock:
+                chat = self.chats.get(chat_id)
+            if chat is None:
+                return 404, {'error': {'code': 'NotFound', 'message': 'Chat not found'}}, {}
+            if sub == '/members':
+                self.requests[f'{method} members'] += 1
+                if method == 'POST':
+                    with self._lock:
+                        chat['members'].append(body.get('user@odata.bind'))
+                    return 201, {'id': f'member-{next(self._ids)}'}, {}
+                return 200, {'value': [{'userId': bind} for bind in chat['members']]}, {}
+            if sub and message_id:
+                self.requests['POST pin'] += 1
+                return 204, None, {}
+            if sub == '/messages' and method == 'POST':
+                self.requests['POST messages'] += 1
+                # 佈建期間新聊天的第一則消息會失敗
+                if time.monotonic() - chat['created'] < self.provisioning_delay:
+                    return 404, {'error': {'code': 'NotFound', 'message': 'Chat is being provisioned'}}, {}
+                return 201, {'id': str(next(self._ids))}, {}
+
+        self.requests['unknown'] += 1
+        return 400, {'error': {'code': 'BadRequest', 'message': f'Unsupported {method} {path}'}}, {}
+
+    def _create_chat(self, body):
+        chat_id = f'19:{uuid.uuid4().hex}@thread.v2'
+        chat = {
+            'id': chat_id,
+            'topic': body.get('topic'),
+            'chatType': body.get('chatType'),
+            'webUrl': f'https://teams.microsoft.com/l/chat/{chat_id}/0',
+            'members': [member.get('user@odata.bind') for member in body.get('members') or []],
+            'created': time.monotonic()
+        }
+        with self._lock:
+            self.chats[chat_id] = chat
+        return 201, self._public(chat), {}
+
+    @staticmethod
+    def _public(chat):
+        return {k: v for k, v in chat.items() if k not in ('members', 'created')}
+
+    def _batch(self, steps):
+        responses = []
+        statuses = {}
+        for step in steps:
+            failed = [d for d in step.get('dependsOn') or [] if not 200 <= statuses.get(d, 0) < 300]
+            if failed:
+                status, body, headers = 424, {'error': {'code': 'FailedDependency'}}, {}
+            else:
+                path = urlsplit(step['url']).path
+                status, body, headers = self.dispatch(step['method'], path, step.get('body') or {})
+            statuses[step['id']] = status
+            responses.append({'id': step['id'], 'status': status, 'headers': headers, 'body': body})
+        return responses
+
+    def stats(self):
+        with self._lock:
+            return {'chats': len(self.chats), 'throttled': self.throttled, 'requests': dict(self.requests)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method):
+        graph = self.server.graph
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+        if graph.latency:
+            time.sleep(graph.latency)
+
+        # 去掉版本前綴（/beta、/v1.0）
+        path = urlsplit(self.path).path
+        path = '/' + path.lstrip('/').split('/', 1)[1] if path.count('/') > 1 else path
+        status, payload, headers = graph.dispatch(method, path, body)
+
+        data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if data:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # 用戶端已因逾時而關閉連線
+            pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class MockGraphServer:
+    """在背景執行緒啟動 mock server；url 可設為 TEAMS_CHAT_GRAPH_ROOT"""
+
+    def __init__(self, host='127.0.0.1', port=0, **options):
+        self.graph = MockGraph(**options)
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.graph = self.graph
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Microsoft Graph stand-in')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--throttle', type=float, default=0.0, help='probability of answering 429')
+    parser.add_argument('--provisioning', type=float, default=0.0,
+                        help='seconds a new chat answers 404 to messages')
+    args = parser.parse_args()
+
+    server = MockGraphServer(
+        port=args.port,
+        latency=args.latency,
+        throttle_rate=args.throttle,
+        provisioning_delay=args.provisioning
+    )
+    print(f'Mock Graph listening on {server.url} (set TEAMS_CHAT_GRAPH_ROOT={server.url})')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.graph.stats()))
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
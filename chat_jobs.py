@@ -0,0 +1,87 @@
+import logging
+
+
+def sanitize_chat_name(title):
+    """清理聊天名稱以符合 Teams 的要求"""
+    # 1. 移除開頭和結尾的空白
+    title = title.strip()
+    
+    # 2. 移除不允許的特殊字元
+    # Teams 不允許: <>*%&:{}?+/\|"#
+    invalid_chars = '<>*%&:{}?+/\\|"#'
+    for char in invalid_chars:
+        title = title.replace(char, '-')
+        
+    # 3. 將多個空白替換為單個空白
+    title = ' '.join(title.split())
+    
+    # 4. 限制長度為 250 字元
+    if len(title) > 250:
+        title = title[:247] + '...'
+        
+    # 5. 確保不是空字串
+    if not title:
+        title = 'New Chat'
+        
+    return title
+
+
+def build_chat_job(issue, owner_email, member_emails):
+    """將單一 issue 轉換為 create_teams_chat.main 的參數"""
+    chat_name = sanitize_chat_name(issue['title'])
+    assignee_email = issue.get('assigneeEmail')
+    
+    # 如果有 assignee email，添加到成員列表
+    chat_members = member_emails.copy()
+    if assignee_email and assignee_email not in chat_members:
+        chat_members.append(assignee_email)
+    
+    logging.debug('Issue %s: chat %r, %d members', issue.get('key'), chat_name, len(chat_members))
+    
+    return {
+        'chat_name': chat_name,
+        'owner_email': owner_email,
+        'member_emails': chat_members,
+        'issue_link': issue.get('link'),
+        'issue_key': issue.get('key'),
+        'issue_title': issue.get('title'),
+        'assignee': issue.get('assignee'),
+        'assignee_email': assignee_email
+    }
+
+
+def build_group_jobs(issues, owner_email, member_emails):
+    """
+    依 assigneeEmail 分組，每個 assignee 建立或重用一個聊天，釘選消息列出還沒貼過的 issue 連結。
+    回傳 [(job, 組內 issue 在 issues 中的 index)]；沒有 assignee email 的 issue 與逐一建立時相同。
+    """
+    from create_teams_chat import group_issue_key
+    
+    groups = {}
+    singles = []
+    for index, issue in enumerate(issues):
+        assignee_email = issue.get('assigneeEmail')
+        if assignee_email:
+            groups.setdefault(assignee_email.lower(), []).append(index)
+        else:
+            singles.append([index])
+    
+    jobs = []
+    for indexes in groups.values():
+        first = issues[indexes[0]]
+        job = build_chat_job(first, owner_email, member_emails)
+        group = [
+            {'key': issues[i].get('key'), 'link': issues[i].get('link'), 'title': issues[i].get('title')}
+            for i in indexes
+        ]
+        job.update({
+            'chat_name': sanitize_chat_name(f"{first.get('assignee') or first['assigneeEmail']} - JIRA issues"),
+            'issue_link': None,
+            'issue_key': group_issue_key(first['assigneeEmail']),
+            'issue_title': None,
+            'issues': group
+        })
+        jobs.append((job, indexes))
+    for indexes in singles:
+        jobs.append((build_chat_job(issues[indexes[0]], owner_email, member_emails), indexes))
+    return sorted(jobs, key=lambda item: item[1][0])
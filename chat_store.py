@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB_FILE = os.environ.get(
+    'TEAMS_CHAT_STATE_DB',
+    os.path.join(os.path.expanduser('~'), '.teams_chat_state.db')
+)
+
+# 聊天建立後的各個步驟（add_members：逐一加入建立時被拒絕的成員）
+STEPS = ('add_members', 'link', 'pin', 'greet')
+
+# 與 issue 訊息有關的步驟
+MESSAGE_STEPS = ('link', 'pin', 'greet')
+
+
+def member_set_key(owner_email, member_emails):
+    """擁有者與成員（不分大小寫、不計順序）的雜湊"""
+    emails = {owner_email.lower()} | {email.lower() for email in member_emails if email}
+    return hashlib.sha1(','.join(sorted(emails)).encode('utf-8')).hexdigest()
+
+
+class ChatStore:
+    """
+    本機的 SQLite 索引：issue key + 成員組合 -> 已建立的聊天與各步驟狀態。
+    重複執行時直接回傳已建立的聊天，只補做未完成的步驟。
+    依 assignee 分組的聊天以 assignee 為 key，issue_keys 記錄已經貼過連結的 issues。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_DB_FILE
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            # WAL 讓多個 host 程序可以同時讀取
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS chats (
+                    issue_key TEXT NOT NULL,
+                    member_key TEXT NOT NULL,
+                    chat_id TEXT NOT NULL,
+                    name TEXT,
+                    owner TEXT,
+                    members TEXT,
+                    web_url TEXT,
+                    link INTEGER NOT NULL DEFAULT 0,
+                    pin INTEGER NOT NULL DEFAULT 0,
+                    greet INTEGER NOT NULL DEFAULT 0,
+                    link_message_id TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    add_members INTEGER NOT NULL DEFAULT 1,
+                    pending_members TEXT,
+                    issue_keys TEXT,
+                    PRIMARY KEY (issue_key, member_key)
+                )
+            ''')
+            # 舊版資料庫沒有 add_members 步驟，既有的聊天視為已完成
+            columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(chats)')}
+            if 'add_members' not in columns:
+                self._conn.execute('ALTER TABLE chats ADD COLUMN add_members INTEGER NOT NULL DEFAULT 1')
+                self._conn.execute('ALTER TABLE chats ADD COLUMN pending_members TEXT')
+            if 'issue_keys' not in columns:
+                self._conn.execute('ALTER TABLE chats ADD COLUMN issue_keys TEXT')
+
+    def get(self, issue_key, owner_email, member_emails):
+        """回傳已記錄的聊天（dict），沒有時回傳 None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM chats WHERE issue_key = ? AND member_key = ?',
+                (issue_key, member_set_key(owner_email, member_emails))
+            ).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record['members'] = json.loads(record['members'] or '[]')
+        record['pending_members'] = json.loads(record['pending_members'] or '[]')
+        record['issue_keys'] = json.loads(record['issue_keys'] or '[]')
+        for step in STEPS:
+            record[step] = bool(record[step])
+        return record
+
+    def save_chat(self, issue_key, owner_email, member_emails, chat_id, name, web_url, pending_members=()):
+        """
+        記錄剛建立的聊天（步驟狀態重設為未完成）。
+        pending_members 是建立時被拒絕、還需要逐一加入的成員。
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                '''
+                INSERT OR REPLACE INTO chats
+                    (issue_key, member_key, chat_id, name, owner, members, web_url, created_at, updated_at,
+                     add_members, pending_members)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''',
+                (
+                    issue_key,
+                    member_set_key(owner_email, member_emails),
+                    chat_id,
+                    name,
+                    owner_email,
+                    json.dumps(list(member_emails)),
+                    web_url,
+                    now,
+                    now,
+                    0 if pending_members else 1,
+                    json.dumps(list(pending_members))
+                )
+            )
+
+    def update_steps(self, issue_key, owner_email, member_emails, steps):
+        """更新步驟狀態；steps 可包含 add_members/link/pin/greet、link_message_id 與 issue_keys"""
+        columns = [step for step in STEPS if step in steps]
+        values = [int(bool(steps[step])) for step in columns]
+        if steps.get('link_message_id'):
+            columns.append('link_message_id')
+            values.append(steps['link_message_id'])
+        if 'issue_keys' in steps:
+            columns.append('issue_keys')
+            values.append(json.dumps(sorted(steps['issue_keys'])))
+        if not columns:
+            return
+        assignments = ', '.join(f'{column} = ?' for column in columns)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f'UPDATE chats SET {assignments}, updated_at = ? WHERE issue_key = ? AND member_key = ?',
+                values + [time.time(), issue_key, member_set_key(owner_email, member_emails)]
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
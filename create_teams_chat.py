@@ -1,97 +1,294 @@
-import requests
-from msal import PublicClientApplication
-import webbrowser
-from urllib.parse import quote  # Add this import
-import json
 import time
-from datetime import datetime
-import xml.etree.ElementTree as ET
 import os
-import logging
+import threading
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# requests 與 msal 延後到第一次使用時才載入，縮短 native host 的啟動時間
+from chat_store import MESSAGE_STEPS, ChatStore
+from deadline import Deadline, current_deadline, deadline_scope
+from graph_client import GRAPH_ROOT, MAX_BATCH_STEPS, GraphBatchError, GraphClient, batch_step
+from job_queue import JOB_LEASE, JobQueue
+from metrics import metrics
+from user_cache import UserIdCache
 
 class TokenManager:
+    # access token 到期前多久視為失效（秒）
+    EXPIRY_MARGIN = 60
+    # access token 到期前多久在背景刷新（秒）
+    REFRESH_AHEAD = 300
+    
     def __init__(self):
         self.token_cache_file = os.path.join(os.path.expanduser('~'), '.teams_chat_token.json')
         self.client_id = "a5386bbf-f6f4-4462-9a91-03a57adbadfd"
         self.authority = "https://login.microsoftonline.com/realtek.com"
         self.scope = ["Chat.Create", "Chat.ReadWrite", "User.Read"]
         
-        # 創建 MSAL 應用
+        # 記憶體中的 access token 與到期時間
+        self._lock = threading.RLock()
+        self._access_token = None
+        self._expires_at = 0
+        self._refresh_timer = None
+        
+        from msal import PublicClientApplication
+        from token_cache import LockedTokenCache
+        
+        # 創建 MSAL 應用（使用跨程序共用、以檔案鎖保護的 token 快取）
+        self.token_cache = LockedTokenCache(self.token_cache_file)
         self.app = PublicClientApplication(
             self.client_id,
-            authority=self.authority
+            authority=self.authority,
+            token_cache=self.token_cache
         )
         
         # 載入快取的 token
         self.load_token_cache()
     
     def load_token_cache(self):
-        """載入快取的 token"""
+        """載入快取的 token（檔案未變更時不重新解析）"""
         try:
-            if os.path.exists(self.token_cache_file):
-                with open(self.token_cache_file, 'r') as f:
-                    cache_data = json.load(f)
-                    self.app.token_cache._cache = cache_data
+            self.token_cache.reload_if_changed()
         except Exception as e:
             print(f"Error loading token cache: {e}")
     
     def save_token_cache(self):
-        """保存 token 到快取"""
+        """快取有變更時保存 token"""
         try:
-            cache_data = self.app.token_cache._cache
-            with open(self.token_cache_file, 'w') as f:
-                json.dump(cache_data, f)
+            self.token_cache.flush()
         except Exception as e:
             print(f"Error saving token cache: {e}")
     
+    def _remember(self, result):
+        """記住 access token 與到期時間，並排程背景刷新"""
+        self._access_token = result['access_token']
+        self._expires_at = time.time() + int(result.get('expires_in', 0))
+        self.save_token_cache()
+        self._schedule_refresh()
+        return self._access_token
+    
+    def _schedule_refresh(self):
+        """在 token 到期前於背景執行緒刷新"""
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+        delay = max(self._expires_at - time.time() - self.REFRESH_AHEAD, 0)
+        self._refresh_timer = threading.Timer(delay, self._background_refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+    
+    def _background_refresh(self):
+        """背景刷新 token；失敗時保留現有 token，下次 get_token 再處理"""
+        try:
+            accounts = self.app.get_accounts()
+            if not accounts:
+                return
+            result = self.app.acquire_token_silent(
+                self.scope,
+                account=accounts[0],
+                force_refresh=True
+            )
+            if result and 'access_token' in result:
+                with self._lock:
+                    self._remember(result)
+        except Exception as e:
+            print(f"Error refreshing token in background: {e}")
+    
     def get_token(self):
-        """獲取 access token，優先使用快取"""
-        accounts = self.app.get_accounts()
-        
-        if accounts:
-            # 嘗試使用快取的 token
-            result = self.app.acquire_token_silent(self.scope, account=accounts[0])
-            if result:
-                return result['access_token']
-        
-        # 如果沒有快取或快取已過期，重新獲取
-        # 使用 prompt=none 避免顯示賬號選擇器
-        result = self.app.acquire_token_interactive(
-            self.scope,
-            prompt="none"  # 不顯示賬號選擇器
-        )
-        if result:
-            self.save_token_cache()
-            return result['access_token']
-        
-        raise Exception("Failed to get access token")
+        """獲取 access token，優先使用記憶體中的 token，其次是快取"""
+        with self._lock:
+            if self._access_token and time.time() < self._expires_at - self.EXPIRY_MARGIN:
+                return self._access_token
+            
+            accounts = self.app.get_accounts()
+            
+            if accounts:
+                # 嘗試使用快取的 token
+                result = self.app.acquire_token_silent(self.scope, account=accounts[0])
+                if result and 'access_token' in result:
+                    return self._remember(result)
+            
+            # 如果沒有快取或快取已過期，重新獲取
+            # 使用 prompt=none 避免顯示賬號選擇器
+            result = self.app.acquire_token_interactive(
+                self.scope,
+                prompt="none"  # 不顯示賬號選擇器
+            )
+            if result and 'access_token' in result:
+                return self._remember(result)
+            
+            raise Exception("Failed to get access token")
 
-# 創建全局 TokenManager 實例
-token_manager = TokenManager()
+class StaticTokenManager:
+    """固定回傳 TEAMS_CHAT_ACCESS_TOKEN 的 token（對 mock Graph server 測試時使用，不載入 msal）"""
+    
+    def __init__(self, access_token):
+        self.access_token = access_token
+    
+    def get_token(self):
+        return self.access_token
 
-# Function to create a Teams chat
-def create_teams_chat(access_token, chat_name, owner_email):
-    url = "https://graph.microsoft.com/beta/chats"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
+# 全局 TokenManager 實例，第一次需要時才建立
+_token_manager = None
+_token_manager_lock = threading.Lock()
+
+def get_token_manager():
+    """取得全局 TokenManager，第一次呼叫時才建立 MSAL 應用並讀取 token 檔"""
+    global _token_manager
+    if _token_manager is None:
+        with _token_manager_lock:
+            if _token_manager is None:
+                static_token = os.environ.get('TEAMS_CHAT_ACCESS_TOKEN')
+                _token_manager = StaticTokenManager(static_token) if static_token else TokenManager()
+    return _token_manager
+
+# 全局 ChatStore 實例（issue -> 已建立的聊天），第一次需要時才開啟
+_chat_store = None
+_chat_store_lock = threading.Lock()
+
+def get_chat_store():
+    """取得全局 ChatStore；無法開啟資料庫時回傳 None（不影響建立聊天）"""
+    global _chat_store
+    if _chat_store is None:
+        with _chat_store_lock:
+            if _chat_store is None:
+                try:
+                    _chat_store = ChatStore()
+                except Exception as e:
+                    print(f"Error opening chat store: {e}")
+                    return None
+    return _chat_store
+
+# 全局持久化工作佇列，第一次需要時才開啟
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """取得全局 JobQueue；無法開啟資料庫時回傳 None（不影響建立聊天）"""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                try:
+                    _job_queue = JobQueue()
+                except Exception as e:
+                    print(f"Error opening job queue: {e}")
+                    return None
+    return _job_queue
+
+# 全局 email -> 使用者 ID 快取
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+def get_user_cache():
+    """取得全局 UserIdCache（第一次呼叫時從磁碟載入）"""
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                _user_cache = UserIdCache()
+    return _user_cache
+
+def __getattr__(name):
+    # 保留 create_teams_chat.token_manager 的存取方式
+    if name == 'token_manager':
+        return get_token_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def preload():
+    """預先載入 requests/msal 並建立 TokenManager 與連線池（不發出 Graph 請求）"""
+    get_token_manager()
+    graph_client.session
+
+def warmup(connections=None):
+    """
+    在使用者按下建立之前先取得 access token，並預先建立 Graph 連線池中的連線。
+    回傳各階段花費的毫秒數與新建立的連線數。
+    """
+    connections = connections or DEFAULT_CONCURRENCY
+    timings = {}
+    
+    started = time.perf_counter()
+    with metrics.span('warmup.token'):
+        access_token = get_token_manager().get_token()
+    timings['tokenMs'] = round((time.perf_counter() - started) * 1000, 1)
+    
+    before = graph_client.connection_stats()['connections_opened']
+    started = time.perf_counter()
+    with metrics.span('warmup.graph'):
+        statuses = graph_client.warmup(access_token, connections)
+    timings['graphMs'] = round((time.perf_counter() - started) * 1000, 1)
+    timings['graphStatus'] = statuses
+    timings['connectionsOpened'] = graph_client.connection_stats()['connections_opened'] - before
+    return timings
+
+# 同時建立聊天的預設併發數
+DEFAULT_CONCURRENCY = int(os.environ.get('TEAMS_CHAT_CONCURRENCY', '4'))
+
+# 新建立的聊天尚未就緒時，發送消息可能回傳的狀態碼
+CHAT_NOT_READY_STATUS = (403, 404)
+
+# 等待新聊天就緒的最長時間（秒）
+CHAT_READY_TIMEOUT = float(os.environ.get('TEAMS_CHAT_READY_TIMEOUT', '15'))
+
+# 每個 issue 與每批次的時間預算（秒，0 表示不限制）
+ISSUE_DEADLINE = float(os.environ.get('TEAMS_CHAT_ISSUE_DEADLINE', '120'))
+BATCH_DEADLINE = float(os.environ.get('TEAMS_CHAT_BATCH_DEADLINE', '1800'))
+
+def timeout_result(chat_name, issue_key, seconds, chat_id=None):
+    """超過時間預算的 issue 結果；已完成的步驟保留在 ChatStore，之後可以接手"""
+    return {
+        "timedOut": True,
+        "id": chat_id,
+        "name": chat_name,
+        "issueKey": issue_key,
+        "message": f"Timed out after {seconds:g}s"
     }
+
+def chat_succeeded(result):
+    """建立結果是否成功（None 與逾時都視為失敗）"""
+    return bool(result) and not result.get("timedOut")
+
+# 共用的 Graph 用戶端（連線池大小不小於併發數）
+graph_client = GraphClient(pool_maxsize=max(10, DEFAULT_CONCURRENCY))
+
+def _user_bind(version, email, user_ids=None):
+    """成員綁定的 URL；已解析出 AAD 物件 ID 時使用 ID，否則使用 email"""
+    user_ref = (user_ids or {}).get(email.lower()) or email
+    return f"{GRAPH_ROOT}/{version}/users/{user_ref}"
+
+def _owner_member(owner_email, user_ids=None):
+    return {
+        "@odata.type": "#microsoft.graph.aadUserConversationMember",
+        "roles": ["owner"],
+        "user@odata.bind": _user_bind("v1.0", owner_email, user_ids)
+    }
+
+def _guest_member(member_email, user_ids=None):
+    return {
+        "@odata.type": "#microsoft.graph.aadUserConversationMember",
+        "roles": ["guest"],
+        "visibleHistoryStartDateTime": "0001-01-01T00:00:00Z",
+        "user@odata.bind": _user_bind("beta", member_email, user_ids)
+    }
+
+def _post_chat(access_token, chat_name, owner_email, member_emails, user_ids=None):
+    """發送建立聊天的請求，members 陣列包含擁有者與所有成員"""
+    url = f"{GRAPH_ROOT}/beta/chats"
     
     body = {
         "chatType": "group",
         "topic": chat_name,
-        "members": [
-            {
-                "@odata.type": "#microsoft.graph.aadUserConversationMember",
-                "roles": ["owner"],
-                "user@odata.bind": f"https://graph.microsoft.com/v1.0/users/{owner_email}"
-            }
-        ]
+        "members": [_owner_member(owner_email, user_ids)] + [_guest_member(email, user_ids) for email in member_emails]
     }
     
-    print("Creating chat with owner...")
+    return graph_client.post(url, access_token, json=body)
+
+# Function to create a Teams chat
+def create_teams_chat(access_token, chat_name, owner_email, member_emails=None, user_ids=None):
+    member_emails = member_emails or []
+    
+    print(f"Creating chat with owner and {len(member_emails)} members...")
     try:
-        response = requests.post(url, headers=headers, json=body)
+        response = _post_chat(access_token, chat_name, owner_email, member_emails, user_ids)
         if response.status_code == 201:
             chat = response.json()
             print("Chat created successfully!")
@@ -103,22 +300,92 @@ def create_teams_chat(access_token, chat_name, owner_email):
         print(f"Exception occurred: {str(e)}")
         return None
 
-def add_member_to_chat(access_token, chat_id, member_email):
-    url = f"https://graph.microsoft.com/beta/chats/{chat_id}/members"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+def _rejected_members(response_text, member_emails, user_ids=None):
+    """從錯誤回應中找出被服務拒絕的成員（以 email 或 ID 比對）"""
+    text = (response_text or "").lower()
+    user_ids = user_ids or {}
+    rejected = []
+    for email in member_emails:
+        user_id = user_ids.get(email.lower())
+        if email.lower() in text or (user_id and user_id.lower() in text):
+            rejected.append(email)
+    return rejected
+
+def is_rejected_request(status_code):
+    """4xx（429 以外）表示請求被拒絕而未執行，可以調整內容後重新送出；5xx 時請求可能已經執行"""
+    return 400 <= status_code < 500 and status_code != 429
+
+def create_chat_accepting_members(access_token, chat_name, owner_email, member_emails, user_ids=None):
+    """
+    以單一請求建立包含所有成員的聊天；被服務拒絕的成員先不加入。
+    user_ids 是 resolve_user_ids() 的結果，有 ID 的成員以 ID 綁定。
+    回傳 (chat, rejected_members)
+    """
+    members = []
+    for email in member_emails:
+        if email and email.lower() != owner_email.lower() and email not in members:
+            members.append(email)
     
-    body = {
-        "@odata.type": "#microsoft.graph.aadUserConversationMember",
-        "roles": ["guest"],
-        "visibleHistoryStartDateTime": "0001-01-01T00:00:00Z",
-        "user@odata.bind": f"https://graph.microsoft.com/beta/users/{member_email}"
-    }
+    print(f"Creating chat with owner and {len(members)} members...")
+    try:
+        response = _post_chat(access_token, chat_name, owner_email, members, user_ids)
+    except Exception as e:
+        print(f"Exception occurred: {str(e)}")
+        return None, []
+    
+    if response.status_code == 201:
+        print("Chat created successfully!")
+        return response.json(), []
     
+    print(f"Error creating chat with all members: {response.status_code} - {response.text}")
+    if not is_rejected_request(response.status_code):
+        # 5xx（例如閘道 504）時聊天可能已經建立，不再送出建立請求以免產生重複的聊天
+        return None, []
+    
+    # 找出被拒絕的成員；無法判斷時全部改為逐一加入
+    rejected = _rejected_members(response.text, members, user_ids) or members
+    accepted = [email for email in members if email not in rejected]
+    
+    chat = None
     try:
-        response = requests.post(url, headers=headers, json=body)
+        if accepted:
+            response = _post_chat(access_token, chat_name, owner_email, accepted, user_ids)
+            if response.status_code == 201:
+                chat = response.json()
+            else:
+                print(f"Error creating chat without rejected members: {response.status_code} - {response.text}")
+                if not is_rejected_request(response.status_code):
+                    return None, []
+                rejected = members
+        if chat is None:
+            chat = create_teams_chat(access_token, chat_name, owner_email, user_ids=user_ids)
+    except Exception as e:
+        print(f"Exception occurred: {str(e)}")
+        return None, []
+    
+    if not chat:
+        return None, []
+    return chat, rejected
+
+def add_members_individually(access_token, chat_id, member_emails, user_ids=None):
+    """逐一加入成員（建立聊天時被拒絕的成員），回傳 (fallback_members, failed_members)"""
+    fallback_members = []
+    failed_members = []
+    for email in member_emails:
+        print(f"\nAdding member via fallback: {email}")
+        if add_member_to_chat(access_token, chat_id, email, user_ids):
+            fallback_members.append(email)
+        else:
+            failed_members.append(email)
+    return fallback_members, failed_members
+
+def add_member_to_chat(access_token, chat_id, member_email, user_ids=None):
+    url = f"{GRAPH_ROOT}/beta/chats/{chat_id}/members"
+    
+    body = _guest_member(member_email, user_ids)
+    
+    try:
+        response = graph_client.post(url, access_token, json=body)
         if response.status_code in [201, 200]:
             print(f"Member {member_email} added successfully!")
             return response.json()
@@ -129,43 +396,105 @@ def add_member_to_chat(access_token, chat_id, member_email):
         print(f"Exception occurred while adding member: {str(e)}")
         return None
 
-def get_teams_chats(access_token):
-    url = "https://graph.microsoft.com/beta/chats"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+def resolve_user_ids(access_token, emails):
+    """
+    將 email 解析為 AAD 物件 ID，先查快取，其餘以 $batch（每批 20 筆）查詢。
+    回傳 {小寫 email: ID 或 None}；None 表示使用者不存在。
+    查詢失敗（非 404）的 email 不會出現在結果中，呼叫端仍可用 email 綁定。
+    """
+    cache = get_user_cache()
+    resolved = {}
+    pending = []
+    seen = set()
+    for email in emails:
+        if not email or email.lower() in seen:
+            continue
+        seen.add(email.lower())
+        hit, user_id = cache.get(email)
+        if hit:
+            resolved[email.lower()] = user_id
+        else:
+            pending.append(email)
+    
+    for start in range(0, len(pending), MAX_BATCH_STEPS):
+        chunk = pending[start:start + MAX_BATCH_STEPS]
+        steps = [
+            batch_step(str(index), "GET", f"/users/{quote(email, safe='@')}?$select=id")
+            for index, email in enumerate(chunk)
+        ]
+        try:
+            responses = graph_client.batch(steps, access_token, version="v1.0")
+        except Exception as e:
+            print(f"Error resolving users: {str(e)}")
+            continue
+        for index, email in enumerate(chunk):
+            response = responses.get(str(index))
+            if response is None:
+                continue
+            if response.status_code == 200:
+                user_id = response.json().get("id")
+                resolved[email.lower()] = user_id
+                cache.put(email, user_id)
+            elif response.status_code == 404:
+                resolved[email.lower()] = None
+                cache.put(email, None)
+            else:
+                print(f"Error resolving {email}: {response.status_code} - {response.text}")
     
+    cache.save()
+    return resolved
+
+# 列出聊天時只取需要的欄位
+CHAT_LIST_FIELDS = "id,topic,chatType,webUrl,createdDateTime,lastUpdatedDateTime"
+
+# /chats 每頁最多 50 筆
+CHAT_PAGE_SIZE = 50
+
+class GraphListError(Exception):
+    """列出集合時 Graph 回傳錯誤"""
+
+def iter_graph_collection(access_token, url, params=None):
+    """逐頁讀取 Graph 集合並逐筆 yield，只在需要下一頁時才跟隨 @odata.nextLink"""
+    while url:
+        response = graph_client.get(url, access_token, params=params)
+        if response.status_code != 200:
+            raise GraphListError(f"Error listing {url}: {response.status_code} - {response.text}")
+        page = response.json()
+        for item in page.get("value", []):
+            yield item
+        # nextLink 已包含所有查詢參數
+        url = page.get("@odata.nextLink")
+        params = None
+
+def iter_teams_chats(access_token, expand_members=True, fields=CHAT_LIST_FIELDS, page_size=CHAT_PAGE_SIZE):
+    """逐筆列出聊天；expand_members=True 時成員會直接包含在每個聊天的 members 中"""
+    params = {
+        "$select": fields,
+        "$top": page_size
+    }
+    if expand_members:
+        params["$expand"] = "members"
+    return iter_graph_collection(access_token, f"{GRAPH_ROOT}/beta/chats", params)
+
+def iter_chat_members(access_token, chat_id):
+    """逐筆列出單一聊天的成員"""
+    url = f"{GRAPH_ROOT}/beta/chats/{chat_id}/members"
+    return iter_graph_collection(access_token, url)
+
+def get_teams_chats(access_token):
+    """列出所有聊天（含成員）；大量資料請直接使用 iter_teams_chats"""
     try:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Error getting chats: {response.status_code} - {response.text}")
-            return None
+        return {"value": list(iter_teams_chats(access_token))}
     except Exception as e:
-        print(f"Exception occurred: {str(e)}")
+        print(f"Error getting chats: {str(e)}")
         return None
 
 def get_chat_members(access_token, chat_id):
-    url = f"https://graph.microsoft.com/beta/chats/{chat_id}/members"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    
+    """列出聊天成員；大量資料請直接使用 iter_chat_members"""
     try:
-        response = requests.get(url, headers=headers)
-        print("Members Response status code:", response.status_code)
-        print("Members Response content:", response.text)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Error getting chat members: {response.status_code} - {response.text}")
-            return None
+        return {"value": list(iter_chat_members(access_token, chat_id))}
     except Exception as e:
-        print(f"Exception occurred: {str(e)}")
+        print(f"Error getting chat members: {str(e)}")
         return None
 
 def handle_message(message):
@@ -177,12 +506,19 @@ def handle_message(message):
             owner_email = message.get('ownerEmail')
             member_emails = message.get('memberEmails', [])
             
-            results = []
-            for issue in selected_issues:
-                result = create_teams_chat_single(issue['title'], owner_email, member_emails)
-                if result:
-                    results.append(result)
-                time.sleep(2)  # 避免請求過快
+            chat_jobs = [
+                {
+                    'chat_name': issue['title'],
+                    'owner_email': owner_email,
+                    'member_emails': member_emails
+                }
+                for issue in selected_issues
+            ]
+            results = [
+                result
+                for result in create_chats_concurrently(chat_jobs, message.get('concurrency'))
+                if result
+            ]
             
             return {
                 'success': True,
@@ -197,8 +533,130 @@ def handle_message(message):
             'message': str(e)
         }
 
-def main(chat_name, owner_email, member_emails, issue_link=None, issue_key=None, issue_title=None, assignee=None, assignee_email=None):
-    """創建 Teams 聊天"""
+def create_chats_concurrently(chat_jobs, max_workers=None, on_result=None, job_ids=None, deadline=None, job_owner=None):
+    """
+    以有限併發數同時建立多個聊天，每個 job 是 main() 的參數 dict。
+    結果依輸入順序回傳，失敗的 job 對應 None，超過時間預算的 job 對應 timeout_result()。
+    整批受 deadline（秒，預設 BATCH_DEADLINE）限制：尚未開始的 job 直接取消，執行中的 job 在下一個
+    Graph 呼叫或等待時中止。
+    on_result(index, result) 會在每個 job 完成時（依完成順序）被呼叫。
+    每個 job 先寫入持久化佇列；程序中斷時可由 resume_interrupted_jobs() 接手。
+    job_ids 是已在佇列中、由 job_owner 擁有的 job（接手時使用）。
+    批次執行期間定期續約，排隊中的 job 不會被其他批次當成中斷的 job 重複執行。
+    """
+    if not chat_jobs:
+        return []
+    
+    deadline = deadline if deadline is not None else BATCH_DEADLINE
+    batch_deadline = Deadline(deadline) if deadline else None
+    
+    queue = get_job_queue()
+    if queue and job_ids is None:
+        job_owner = queue.batch_owner()
+        try:
+            job_ids = queue.enqueue(chat_jobs, job_owner)
+        except Exception as e:
+            print(f"Error recording jobs: {str(e)}")
+    journaled = bool(queue and job_ids)
+    
+    max_workers = max(1, min(int(max_workers or DEFAULT_CONCURRENCY), len(chat_jobs)))
+    
+    # 先在目前執行緒取得 token，避免多個執行緒同時觸發互動式登入；
+    # 同時一次解析整批的成員，之後每個聊天直接使用快取（受批次時間預算限制）
+    try:
+        with deadline_scope(batch_deadline):
+            with metrics.span('token'):
+                access_token = get_token_manager().get_token()
+            emails = []
+            for job in chat_jobs:
+                emails.append(job['owner_email'])
+                emails.extend(job.get('member_emails') or [])
+            with metrics.span('batch.resolve_users', emails=len(emails)):
+                resolve_user_ids(access_token, emails)
+    except Exception as e:
+        print(f"Error preparing batch: {str(e)}")
+    
+    def run_job(index):
+        job = chat_jobs[index]
+        if batch_deadline and batch_deadline.expired():
+            # 批次時間用完，尚未開始的 job 取消（留在佇列中，之後可接手）
+            result = timeout_result(job.get('chat_name'), job.get('issue_key'), batch_deadline.seconds)
+            if journaled:
+                queue.release(job_ids[index], job_owner, result['message'])
+            return result
+        if journaled and not queue.start(job_ids[index], job_owner):
+            print(f"Job for {job.get('issue_key')} was taken over by another batch")
+            return None
+        with deadline_scope(batch_deadline):
+            result = main(**job)
+        if journaled:
+            if result and result.get('timedOut'):
+                queue.release(job_ids[index], job_owner, result['message'])
+            else:
+                queue.finish(job_ids[index], job_owner, bool(result), None if result else "Failed to create chat")
+        return result
+    
+    stop_renewing = threading.Event()
+    
+    def renew_leases():
+        while not stop_renewing.wait(min(JOB_LEASE / 3, 60)):
+            try:
+                queue.renew(job_ids, job_owner)
+            except Exception as e:
+                print(f"Error renewing job leases: {str(e)}")
+    
+    if journaled:
+        threading.Thread(target=renew_leases, name="job-lease", daemon=True).start()
+    
+    results = [None] * len(chat_jobs)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat") as executor:
+            futures = {
+                executor.submit(run_job, index): index
+                for index in range(len(chat_jobs))
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    print(f"Error in chat job {index}: {str(e)}")
+                if on_result:
+                    try:
+                        on_result(index, results[index])
+                    except Exception as e:
+                        print(f"Error reporting result of chat job {index}: {str(e)}")
+    finally:
+        # 批次中止時也要停止續約，未完成的 job 才能被接手
+        stop_renewing.set()
+    
+    return results
+
+def resume_interrupted_jobs(max_workers=None, on_result=None):
+    """
+    接手先前程序中斷時未完成的 job，從各自停下的步驟繼續。
+    回傳 [(params, result)]；沒有中斷的 job 時回傳空 list。
+    """
+    queue = get_job_queue()
+    if not queue:
+        return []
+    job_owner = queue.batch_owner()
+    claimed = queue.claim_interrupted(job_owner)
+    if not claimed:
+        return []
+    print(f"Resuming {len(claimed)} interrupted chat jobs")
+    job_ids = [job_id for job_id, _ in claimed]
+    chat_jobs = [params for _, params in claimed]
+    results = create_chats_concurrently(chat_jobs, max_workers, on_result, job_ids=job_ids, job_owner=job_owner)
+    return list(zip(chat_jobs, results))
+
+def main(chat_name, owner_email, member_emails, issue_link=None, issue_key=None, issue_title=None, assignee=None, assignee_email=None, issues=None):
+    """
+    創建 Teams 聊天。
+    issues 是同一 assignee 的 issues（[{'key', 'link', 'title'}]）時，
+    建立或重用該 assignee 與成員組合的聊天，釘選的消息列出尚未貼過的 issue 連結；
+    issue_key 為 group_issue_key(assignee_email)。
+    """
     try:
         # 如果沒有指定 chat_name，使用預設值
         if chat_name is None:
@@ -212,71 +670,95 @@ def main(chat_name, owner_email, member_emails, issue_link=None, issue_key=None,
             issue_key=issue_key,
             issue_title=issue_title,
             assignee=assignee,
-            assignee_email=assignee_email
+            assignee_email=assignee_email,
+            issues=issues
         )
     except Exception as e:
         print(f"Error in main: {str(e)}")
         return None
 
-def send_pinned_link(access_token, chat_id, issue_link, issue_key):
-    """發送並釘選 issue 連結"""
-    url = f"https://graph.microsoft.com/beta/chats/{chat_id}/messages"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
+def group_issue_key(assignee_email):
+    """
+    依 assignee 分組的聊天在 ChatStore 與 trace 中使用的 key。
+    與成員組合一起決定聊天，之後加入的 issue 會貼到同一個聊天中。
+    """
+    return f"assignee:{assignee_email.lower()}"
+
+def _issue_link_body(issue_link, issue_key, issues=None):
+    """issue 連結消息內容；issues 有值時列出所有 issue 的連結"""
+    if issues:
+        links = '<br>'.join(f"<a href='{issue['link']}'>{issue['key']}</a>" for issue in issues)
+        message = f"<p>{links}</p>"
+    else:
+        message = f"<p><a href='{issue_link}'>{issue_key}</a></p>"
+    return {
+        "body": {
+            "contentType": "html",
+            "content": message
+        }
     }
+
+def _greeting_body(issue_title, assignee=None, assignee_email=None, issues=None):
+    """初始問候消息內容；issues 有值時列出所有 issue 的標題"""
+    # 使用已有的 assignee 名字
+    assignee_name = assignee or assignee_email.split('@')[0]
     
-    # 發送消息
-    message = f"<p><a href='{issue_link}'>{issue_key}</a></p>"
-    body = {
+    # 構建消息內容
+    if issues:
+        titles = '<br>'.join(issue['title'] for issue in issues)
+        message = f"""<p>hello {assignee_name}</p>
+<p>請協助查看以下 {len(issues)} 個問題,謝謝</p>
+<p>{titles}</p>"""
+    else:
+        message = f"""<p>hello {assignee_name}</p>
+<p>請協助查看 {issue_title}</p>
+<p>的問題,謝謝</p>"""
+
+    return {
         "body": {
             "contentType": "html",
             "content": message
         }
     }
+
+def send_pinned_link(access_token, chat_id, issue_link, issue_key, issues=None):
+    """發送並釘選 issue 連結"""
+    url = f"{GRAPH_ROOT}/beta/chats/{chat_id}/messages"
+    
+    # 發送消息
+    body = _issue_link_body(issue_link, issue_key, issues)
     
     try:
-        response = requests.post(url, headers=headers, json=body)
+        response = graph_client.post(url, access_token, json=body)
         if response.status_code == 201:
             # 獲取消息 ID
             message_id = response.json().get('id')
             
             # 釘選消息
-            pin_url = f"https://graph.microsoft.com/beta/chats/{chat_id}/messages/{message_id}/pin"
-            pin_response = requests.post(pin_url, headers=headers)
-            
-            return pin_response.status_code in [201, 204]
+            return pin_message(access_token, chat_id, message_id)
         return False
     except Exception as e:
         print(f"Error sending/pinning issue link: {str(e)}")
         return False
 
-def send_chat_message(access_token, chat_id, issue_key, issue_title, assignee=None, assignee_email=None):
+def pin_message(access_token, chat_id, message_id):
+    """釘選聊天中的消息"""
+    pin_url = f"{GRAPH_ROOT}/beta/chats/{chat_id}/messages/{message_id}/pin"
+    try:
+        pin_response = graph_client.post(pin_url, access_token)
+        return pin_response.status_code in [201, 204]
+    except Exception as e:
+        print(f"Error pinning message: {str(e)}")
+        return False
+
+def send_chat_message(access_token, chat_id, issue_key, issue_title, assignee=None, assignee_email=None, issues=None):
     """發送格式化的聊天消息"""
-    url = f"https://graph.microsoft.com/beta/chats/{chat_id}/messages"
+    url = f"{GRAPH_ROOT}/beta/chats/{chat_id}/messages"
     
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    
-    # 使用已有的 assignee 名字
-    assignee_name = assignee or assignee_email.split('@')[0]
-    
-    # 構建消息內容
-    message = f"""<p>hello {assignee_name}</p>
-<p>請協助查看 {issue_title}</p>
-<p>的問題,謝謝</p>"""
-
-    body = {
-        "body": {
-            "contentType": "html",
-            "content": message
-        }
-    }
+    body = _greeting_body(issue_title, assignee, assignee_email, issues)
     
     try:
-        response = requests.post(url, headers=headers, json=body)
+        response = graph_client.post(url, access_token, json=body)
         if response.status_code == 201:
             print("Message sent successfully!")
             return True
@@ -288,122 +770,275 @@ def send_chat_message(access_token, chat_id, issue_key, issue_title, assignee=No
         print(f"Exception occurred while sending message: {str(e)}")
         return False
 
-def create_teams_chat_single(chat_name, owner_email, member_emails, issue_link=None, issue_key=None, issue_title=None, assignee=None, assignee_email=None):
-    """創建單個 Teams 聊天"""
+def retry_until_chat_ready(send, first_response, chat_id, timeout=None):
+    """
+    執行 send()，若第一則消息因聊天尚未就緒而失敗（403/404），
+    以短的指數退避重試，直到成功或超過期限。
+    first_response 從 send() 的結果取出第一則消息的回應。
+    """
+    timeout = CHAT_READY_TIMEOUT if timeout is None else timeout
+    # 不超過 issue/批次剩餘的時間預算
+    budget = current_deadline()
+    limited_by_budget = budget is not None and budget.remaining() < timeout
+    if limited_by_budget:
+        timeout = budget.remaining()
+    deadline = time.monotonic() + timeout
+    delay = 0.25
+    while True:
+        result = send()
+        response = first_response(result)
+        if response is None or response.status_code not in CHAT_NOT_READY_STATUS:
+            return result
+        if time.monotonic() + delay > deadline:
+            print(f"Chat {chat_id} still not ready after {timeout}s")
+            if limited_by_budget:
+                budget.give_up()
+            return result
+        print(f"Chat {chat_id} not ready yet ({response.status_code}), retrying in {delay:.2f}s")
+        with metrics.span('wait.chat_ready'):
+            time.sleep(delay)
+        delay = min(delay * 2, 2.0)
+
+def send_issue_messages(access_token, chat_id, issue_link, issue_key, issue_title, assignee=None, assignee_email=None, ready_timeout=None, issues=None):
+    """
+    以 $batch 發送 issue 連結與初始消息（dependsOn 保證順序），再釘選連結消息。
+    Graph $batch 無法在同一批次中引用前一步驟回應的 id，因此釘選在第二個請求中完成。
+    回傳各步驟結果：{'link': bool, 'pin': bool, 'greet': bool, 'link_message_id': str}
+    """
+    steps = [
+        batch_step("link", "POST", f"/chats/{chat_id}/messages",
+                   body=_issue_link_body(issue_link, issue_key, issues)),
+        batch_step("greet", "POST", f"/chats/{chat_id}/messages",
+                   body=_greeting_body(issue_title, assignee, assignee_email, issues),
+                   depends_on=["link"])
+    ]
+    
     try:
-        access_token = token_manager.get_token()
-        print("Access Token acquired successfully")
+        # 新建立的聊天可能尚未就緒，第一則消息失敗時以退避重試到期限為止
+        responses = retry_until_chat_ready(
+            lambda: graph_client.batch(steps, access_token),
+            lambda responses: responses.get("link"),
+            chat_id,
+            ready_timeout
+        )
+    except Exception as e:
+        if isinstance(e, GraphBatchError) and not is_rejected_request(e.status_code):
+            # 5xx 時批次中的消息可能已經送出，不改用逐一發送以免重複；步驟記錄為未完成
+            print(f"Batch request failed with {e.status_code}, not resending messages: {str(e)}")
+            return {'link': False, 'pin': False, 'greet': False, 'link_message_id': None}
+        # 批次請求本身被拒絕時，改用逐一發送
+        print(f"Batch request failed, falling back to sequential calls: {str(e)}")
+        pinned = send_pinned_link(access_token, chat_id, issue_link, issue_key, issues)
+        greeted = send_chat_message(access_token, chat_id, issue_key, issue_title, assignee, assignee_email, issues)
+        return {'link': pinned, 'pin': pinned, 'greet': greeted, 'link_message_id': None}
+    
+    link_response = responses.get("link")
+    greet_response = responses.get("greet")
+    result = {
+        'link': bool(link_response and link_response.status_code == 201),
+        'pin': False,
+        'greet': bool(greet_response and greet_response.status_code == 201),
+        'link_message_id': None
+    }
+    
+    for name, response in (("link", link_response), ("greet", greet_response)):
+        if response is None or response.status_code != 201:
+            status = response.status_code if response else "missing"
+            text = response.text if response else ""
+            print(f"Error in batch step {name}: {status} - {text}")
+    
+    if result['link']:
+        result['link_message_id'] = link_response.json().get('id')
+        result['pin'] = pin_message(access_token, chat_id, result['link_message_id'])
+    
+    return result
+
+def complete_issue_steps(access_token, chat_id, done, issue_link, issue_key, issue_title, assignee=None, assignee_email=None, issues=None):
+    """
+    只執行尚未完成的步驟（link/pin/greet）。
+    done 是先前記錄的步驟狀態；全新的聊天傳入空 dict。
+    """
+    if not done.get('link'):
+        return send_issue_messages(
+            access_token,
+            chat_id,
+            issue_link,
+            issue_key,
+            issue_title,
+            assignee,
+            assignee_email,
+            issues=issues
+        )
+    
+    result = {
+        'link': True,
+        'pin': bool(done.get('pin')),
+        'greet': bool(done.get('greet')),
+        'link_message_id': done.get('link_message_id')
+    }
+    if not result['pin'] and result['link_message_id']:
+        result['pin'] = pin_message(access_token, chat_id, result['link_message_id'])
+    if not result['greet']:
+        result['greet'] = send_chat_message(access_token, chat_id, issue_key, issue_title, assignee, assignee_email, issues)
+    return result
+
+def create_teams_chat_single(chat_name, owner_email, member_emails, issue_link=None, issue_key=None, issue_title=None, assignee=None, assignee_email=None, issues=None):
+    """
+    創建單個 Teams 聊天。
+    同一 issue 與成員組合已建立過時，不呼叫 Graph 直接回傳，或只補做未完成的步驟。
+    每個聊天的各步驟耗時寫入一行 trace。
+    整個 issue 受 ISSUE_DEADLINE 限制，超過時回傳 timeout_result()。
+    """
+    with metrics.trace(issue=issue_key, chat=chat_name) as trace:
+        with metrics.span('chat.total'), deadline_scope(ISSUE_DEADLINE or None) as deadline:
+            result = _create_teams_chat_single(
+                chat_name, owner_email, member_emails, issue_link, issue_key,
+                issue_title, assignee, assignee_email, issues
+            )
+            if deadline is not None and deadline.timed_out():
+                print(f"Chat for {issue_key or chat_name} timed out after {deadline.seconds:g}s")
+                result = timeout_result(chat_name, issue_key, deadline.seconds, result and result.get('id'))
+        trace['success'] = chat_succeeded(result)
+        trace['timedOut'] = bool(result and result.get('timedOut'))
+        trace['reused'] = bool(result and result.get('reused'))
+        return result
+
+def _create_teams_chat_single(chat_name, owner_email, member_emails, issue_link, issue_key, issue_title, assignee, assignee_email, issues=None):
+    try:
+        has_issue_info = bool(issues) or bool(issue_link and issue_key and issue_title)
+        store = get_chat_store() if issue_key else None
+        record = store.get(issue_key, owner_email, member_emails) if store else None
+        
+        # 分組聊天：只貼出聊天中還沒有的 issue 連結（新的一則釘選消息）
+        done = record or {}
+        posted_keys = set(record['issue_keys']) if record else set()
+        if issues:
+            new_issues = [issue for issue in issues if issue['key'] not in posted_keys]
+            if new_issues and record:
+                print(f"Adding {len(new_issues)} issues to chat {record['chat_id']}")
+                done = {}
+            issues = new_issues or issues
+        
+        required_steps = ('add_members',) + (MESSAGE_STEPS if has_issue_info else ())
+        if record and done is record and all(record[step] for step in required_steps):
+            print(f"Chat for {issue_key} already exists: {record['chat_id']}")
+            return {
+                "id": record['chat_id'],
+                "name": record['name'] or chat_name,
+                "owner": owner_email,
+                "members": member_emails,
+                "fallbackMembers": [],
+                "failedMembers": [],
+                "webUrl": record['web_url'],
+                "reused": True
+            }
         
-        # 創建聊天
-        chat = create_teams_chat(access_token, chat_name, owner_email)
+        with metrics.span('token'):
+            access_token = get_token_manager().get_token()
+        print("Access Token acquired successfully")
         
-        if chat:
+        fallback_members = []
+        failed_members = []
+        pending_members = []
+        user_ids = None
+        if record:
+            chat_id = record['chat_id']
+            print(f"Resuming unfinished steps for chat {chat_id}")
+            if not record['add_members']:
+                pending_members = record['pending_members']
+                user_ids = resolve_user_ids(access_token, pending_members)
+        else:
+            # 建立聊天前先解析並驗證所有成員
+            with metrics.span('step.resolve_users'):
+                user_ids = resolve_user_ids(access_token, [owner_email] + list(member_emails))
+            if owner_email.lower() in user_ids and user_ids[owner_email.lower()] is None:
+                print(f"Owner {owner_email} does not exist")
+                return None
+            invalid_members = [
+                email for email in member_emails
+                if email.lower() in user_ids and user_ids[email.lower()] is None
+            ]
+            if invalid_members:
+                print(f"Rejecting unknown members: {invalid_members}")
+            valid_members = [email for email in member_emails if email not in invalid_members]
+            
+            # 以單一請求創建聊天並加入所有成員；被拒絕的成員記錄下來再逐一加入
+            with metrics.span('step.create_chat', members=len(valid_members)):
+                chat, pending_members = create_chat_accepting_members(
+                    access_token,
+                    chat_name,
+                    owner_email,
+                    valid_members,
+                    user_ids
+                )
+            if not chat:
+                return None
+            failed_members = invalid_members
             chat_id = chat["id"]
             print(f"Chat created with ID: {chat_id}")
-            
-            # 添加其他成員
-            for email in member_emails:
-                print(f"\nAdding member: {email}")
-                add_member_to_chat(access_token, chat_id, email)
-            
-            # 如果有 issue 資訊，發送消息
-            if issue_link and issue_key and issue_title:
-                time.sleep(2)  # 等待群組創建完成
-                
-                # 發送並釘選 issue 連結
-                send_pinned_link(access_token, chat_id, issue_link, issue_key)
-                
-                time.sleep(1)  # 稍等一下，確保消息順序
-                
-                # 發送初始消息
-                send_chat_message(
+            if store:
+                store.save_chat(
+                    issue_key,
+                    owner_email,
+                    member_emails,
+                    chat_id,
+                    chat_name,
+                    f"https://teams.microsoft.com/l/chat/{chat_id}/0",
+                    pending_members
+                )
+        
+        if pending_members:
+            with metrics.span('step.add_members', members=len(pending_members)):
+                fallback_members, add_failed = add_members_individually(
+                    access_token,
+                    chat_id,
+                    pending_members,
+                    user_ids
+                )
+            failed_members = failed_members + add_failed
+            if store:
+                store.update_steps(issue_key, owner_email, member_emails, {'add_members': True})
+        
+        # 如果有 issue 資訊，發送消息
+        if has_issue_info:
+            # 發送 issue 連結與初始消息，並釘選連結（等待聊天就緒）
+            with metrics.span('step.messages'):
+                steps = complete_issue_steps(
                     access_token,
                     chat_id,
+                    done,
+                    issue_link,
                     issue_key,
                     issue_title,
                     assignee,
-                    assignee_email
+                    assignee_email,
+                    issues
                 )
-            
-            return {
-                "id": chat_id,
-                "name": chat_name,
-                "owner": owner_email,
-                "members": member_emails,
-                "webUrl": f"https://teams.microsoft.com/l/chat/{chat_id}/0"
-            }
+            print(f"Post-creation steps: {steps}")
+            if store:
+                if issues and steps.get('link'):
+                    posted_keys |= {issue['key'] for issue in issues}
+                    store.update_steps(issue_key, owner_email, member_emails, dict(steps, issue_keys=posted_keys))
+                else:
+                    store.update_steps(issue_key, owner_email, member_emails, steps)
+        
+        print(f"Graph connection stats: {graph_client.connection_stats()}")
+        print(f"Graph rate limiter stats: {graph_client.rate_limiter.stats()}")
+        
+        return {
+            "id": chat_id,
+            "name": chat_name,
+            "owner": owner_email,
+            "members": member_emails,
+            "fallbackMembers": fallback_members,
+            "failedMembers": failed_members,
+            "webUrl": f"https://teams.microsoft.com/l/chat/{chat_id}/0",
+            "reused": bool(record)
+        }
     except Exception as e:
         print(f"Error creating chat: {str(e)}")
         return None
 
-def create_chat(app, chat_name, owner_email, member_emails):
-    """
-    建立 Teams 聊天
-    """
-    try:
-        # 建立聊天的請求內容
-        chat_request = {
-            "chatType": "group",
-            "topic": chat_name,
-            "members": [
-                {
-                    "@odata.type": "#microsoft.graph.aadUserConversationMember",
-                    "roles": ["owner"],
-                    "user": {
-                        "email": owner_email
-                    }
-                }
-            ]
-        }
-        
-        # 添加所有成員到初始請求中
-        for email in member_emails:
-            chat_request["members"].append({
-                "@odata.type": "#microsoft.graph.aadUserConversationMember",
-                "roles": [],
-                "user": {
-                    "email": email
-                }
-            })
-            
-        # 建立聊天
-        try:
-            response = app.client.post("/beta/chats", json=chat_request)
-            chat_id = response.json()['id']
-            
-            # 發送初始訊息
-            initial_message = {
-                "body": {
-                    "content": f"Chat created for: {chat_name}",
-                    "contentType": "text"
-                }
-            }
-            message = app.client.post(f"/beta/chats/{chat_id}/messages", json=initial_message)
-            
-            # 嘗試釘選訊息 (如果失敗也不中斷流程)
-            try:
-                message_id = message.json()['id']
-                app.client.post(f"/beta/chats/{chat_id}/messages/{message_id}/pin")
-            except Exception as e:
-                logging.warning(f"Failed to pin message: {str(e)}")
-                
-            # 返回聊天資訊
-            return {
-                'id': chat_id,
-                'name': chat_name,
-                'owner': owner_email,
-                'members': member_emails,
-                'webUrl': f"https://teams.microsoft.com/l/chat/{chat_id}/0"
-            }
-            
-        except Exception as e:
-            logging.error(f"Error creating chat: {str(e)}")
-            raise
-            
-    except Exception as e:
-        logging.error(f"Error in create_chat: {str(e)}")
-        raise
-
 if __name__ == "__main__":
     # 測試代碼
     result = main(
@@ -0,0 +1,74 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class DeadlineExceeded(Exception):
+    """超過 issue 或批次的時間預算"""
+
+
+class Deadline:
+    """以 monotonic 時間表示的截止時間"""
+
+    def __init__(self, seconds, expires_at=None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if expires_at is None else expires_at
+        # 因剩餘時間不足而提早放棄（等待或重試會超過截止時間）
+        self.gave_up = False
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def give_up(self):
+        """記錄工作因時間預算而中止，即使截止時間還沒到"""
+        self.gave_up = True
+
+    def timed_out(self):
+        """已過截止時間，或已因時間預算而放棄"""
+        return self.gave_up or self.expired()
+
+    def check(self):
+        if self.expired():
+            self.gave_up = True
+            raise DeadlineExceeded(f"Deadline of {self.seconds:g}s exceeded")
+
+    def clamp(self, timeout):
+        """把 requests 的 timeout（秒數或 (connect, read)）限制在剩餘時間內"""
+        remaining = max(self.remaining(), 0.001)
+        if isinstance(timeout, tuple):
+            return tuple(min(value, remaining) for value in timeout)
+        return min(timeout, remaining) if timeout else remaining
+
+
+_local = threading.local()
+
+
+def current_deadline():
+    """目前執行緒生效的截止時間；沒有時回傳 None"""
+    return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """
+    在區塊內套用截止時間（秒數或 Deadline）。
+    巢狀使用時以較早的截止時間為準，Graph 呼叫與等待都會依剩餘時間縮短或中止。
+    每個區塊使用自己的 Deadline 複本，放棄的記錄（gave_up）不會影響同一批次的其他 issue。
+    """
+    if deadline is None:
+        yield current_deadline()
+        return
+    if not isinstance(deadline, Deadline):
+        deadline = Deadline(deadline)
+    previous = current_deadline()
+    if previous is not None and previous.expires_at < deadline.expires_at:
+        deadline = previous
+    deadline = Deadline(deadline.seconds, deadline.expires_at)
+    _local.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _local.deadline = previous
@@ -15,7 +15,38 @@ document.addEventListener('DOMContentLoaded', async function() {
     saveEmails(ownerEmailInput.value, this.value);
   });
 
-  // 3. 獲取並顯示 JIRA issues
+  document.getElementById('groupByAssignee').addEventListener('change', function() {
+    chrome.storage.sync.set({ 'groupByAssignee': this.checked });
+  });
+
+  // 3. 在使用者選擇 issue 的同時先取得 token 並建立 Graph（與 JIRA）連線，縮短第一次建立聊天的等待
+  chrome.storage.sync.get({ 'jiraUsername': '', 'jiraToken': '' }, function(credentials) {
+    chrome.runtime.sendNativeMessage('com.realtek.teams_chat',
+      {
+        action: 'warmup',
+        jiraUsername: credentials.jiraUsername,
+        jiraToken: credentials.jiraToken
+      },
+      function(response) {
+        if (chrome.runtime.lastError) {
+          console.warn('warmup failed:', chrome.runtime.lastError.message);
+        } else if (response && response.success) {
+          console.log('Host warmed up:', response.result);
+        }
+      }
+    );
+  });
+
+  // 在背景接手先前中斷（popup 關閉、host 結束）的建立聊天工作
+  chrome.runtime.sendNativeMessage('com.realtek.teams_chat', { action: 'resumeJobs' }, function(response) {
+    if (chrome.runtime.lastError) {
+      console.warn('resumeJobs failed:', chrome.runtime.lastError.message);
+    } else if (response && response.resumed) {
+      console.log(`Resumed ${response.resumed} interrupted chat jobs`);
+    }
+  });
+
+  // 4. 獲取並顯示 JIRA issues
   const issuesList = document.getElementById('issuesList');
   const selectAll = document.getElementById('selectAll');
   
@@ -37,26 +68,48 @@ document.addEventListener('DOMContentLoaded', async function() {
       return;
     }
 
-    // 獲取設定的 URL
+    // 一次讀取所有設定
     const settings = await new Promise(resolve => {
       chrome.storage.sync.get({
-        'jiraXmlUrl': 'https://jira.realtek.com/sr/jira.issueviews:searchrequest-xml/59583/SearchRequest-59583.xml?tempMax=1000'
+        'jiraXmlUrl': 'https://jira.realtek.com/sr/jira.issueviews:searchrequest-xml/59583/SearchRequest-59583.xml?tempMax=1000',
+        'jiraUsername': '',
+        'jiraToken': '',
+        'commentHours': 18,  // 預設值為 18
+        'targetUsers': 'JIRAUSER50632,JIRAUSER51966'  // 預設值
       }, resolve);
     });
 
-    // 嘗試獲取 XML
-    const response = await fetch(settings.jiraXmlUrl, {
-      method: 'GET',
-      credentials: 'include',
-      headers: {
-        'Accept': 'application/xml',
-        'Cache-Control': 'no-cache',
-        'Pragma': 'no-cache'
-      }
+    document.getElementById('commentHours').value = settings.commentHours;
+    document.getElementById('targetUsers').value = settings.targetUsers;
+
+    // 在開始載入時顯示進度
+    issuesList.innerHTML = '<div class="loading">Loading and filtering issues...</div>';
+
+    // 由 native host 增量同步 filter 中的 issues，並以本機索引篩選評論
+    const response = await new Promise((resolve, reject) => {
+      chrome.runtime.sendNativeMessage('com.realtek.teams_chat',
+        {
+          action: 'fetchFilteredIssues',
+          mode: 'sync',
+          jiraXmlUrl: settings.jiraXmlUrl,
+          jiraUsername: settings.jiraUsername,
+          jiraToken: settings.jiraToken,
+          commentHours: settings.commentHours,
+          targetUsers: settings.targetUsers
+        },
+        function(response) {
+          if (chrome.runtime.lastError) {
+            reject(new Error(chrome.runtime.lastError.message));
+          } else {
+            resolve(response);
+          }
+        }
+      );
     });
 
-    if (!response.ok) {
-      if (response.status === 401 || response.status === 403) {
+    if (!response || !response.success) {
+      const message = response ? response.message : 'No response from native host';
+      if (/\b(401|403)\b/.test(message)) {
         issuesList.innerHTML = `
           <div class="error">
             No access to JIRA XML view.<br>
@@ -68,113 +121,14 @@ document.addEventListener('DOMContentLoaded', async function() {
       } else {
         issuesList.innerHTML = `
           <div class="error">
-            Error accessing JIRA: ${response.status}<br>
-            Please check your JIRA XML URL in settings
+            Error accessing JIRA: ${message}<br>
+            Please check your JIRA settings
           </div>`;
       }
       return;
     }
 
-    const text = await response.text();
-    const parser = new DOMParser();
-    const xmlDoc = parser.parseFromString(text, 'text/xml');
-    
-    const issues = [];
-    const items = xmlDoc.getElementsByTagName('item');
-    const total = items.length;
-    let processed = 0;
-    
-    // 在開始載入時顯示進度
-    issuesList.innerHTML = '<div class="loading">Loading and filtering issues...</div>';
-
-    // 載入設定
-    chrome.storage.sync.get({
-      'commentHours': 18,  // 預設值為 18
-      'targetUsers': 'JIRAUSER50632,JIRAUSER51966'  // 預設值
-    }, function(result) {
-      document.getElementById('commentHours').value = result.commentHours;
-      document.getElementById('targetUsers').value = result.targetUsers;
-    });
-
-    // 2. 獲取每個 issue 的評論
-    for (const item of items) {
-      const key = item.getElementsByTagName('key')[0]?.textContent;
-      const title = item.getElementsByTagName('title')[0]?.textContent;
-      const link = item.getElementsByTagName('link')[0]?.textContent;
-      
-      try {
-        // 更新進度顯示
-        processed++;
-        issuesList.innerHTML = `<div class="loading">Processing issues... (${processed}/${total})</div>`;
-        
-        // 獲取 issue 詳細資訊
-        const issueDetails = await getIssueDetails(key);
-        
-        // 獲取 issue 的評論
-        const commentsResponse = await fetch(`https://jira.realtek.com/rest/api/2/issue/${key}/comment`, {
-          method: 'GET',
-          credentials: 'include',
-          headers: {
-            'Accept': 'application/json'
-          }
-        });
-        
-        if (!commentsResponse.ok) {
-          console.error(`Failed to fetch comments for ${key}`);
-          continue;
-        }
-        
-        const commentsData = await commentsResponse.json();
-        const comments = commentsData.comments || [];
-        
-        // 獲取設定
-        const settings = await new Promise(resolve => {
-          chrome.storage.sync.get({
-            'commentHours': 18,  // 預設值
-            'targetUsers': 'JIRAUSER50632,JIRAUSER51966'  // 預設值
-          }, resolve);
-        });
-
-        const targetUsers = settings.targetUsers.split(',').map(u => u.trim());
-
-        // 找出指定用戶的最後一則評論
-        let lastTargetUserComment = null;
-
-        // 從後往前找，這樣可以更快找到最後的評論
-        for (let i = comments.length - 1; i >= 0; i--) {
-          const comment = comments[i];
-          if (targetUsers.includes(comment.author.key)) {
-            lastTargetUserComment = comment;
-            break;
-          }
-        }
-
-        // 如果找到指定用戶的評論
-        if (lastTargetUserComment) {
-          const commentCreated = new Date(lastTargetUserComment.created);
-          const now = new Date();
-          const hoursDiff = (now - commentCreated) / (1000 * 60 * 60);
-          
-          // 只檢查時間條件
-          if (hoursDiff <= settings.commentHours) {
-            issues.push({
-              title,
-              link,
-              key,
-              assignee: issueDetails.assigneeName,
-              assigneeEmail: issueDetails.assigneeEmail,
-              lastComment: {
-                author: lastTargetUserComment.author.key,
-                created: commentCreated,
-                body: lastTargetUserComment.body
-              }
-            });
-          }
-        }
-      } catch (error) {
-        console.error(`Error processing issue ${key}:`, error);
-      }
-    }
+    const issues = response.result || [];
 
     // 3. 顯示符合條件的 issues
     if (issues.length === 0) {
@@ -278,111 +232,82 @@ document.getElementById('createChat').addEventListener('click', function() {
     .map(email => email.trim())
     .filter(email => email);
 
-  // 直接發送請求
-  chrome.runtime.sendNativeMessage('com.realtek.teams_chat',
-    {
-      action: 'createSelectedChats',
-      selectedIssues,
-      ownerEmail,
-      memberEmails
-    },
-    function(response) {
-      console.log('Attempting to send message to native host...');
-      
-      if (chrome.runtime.lastError) {
-        console.error('Native messaging error:', chrome.runtime.lastError);
-        status.className = 'error';
-        status.textContent = `Native messaging error: ${chrome.runtime.lastError.message}`;
-        return;
-      }
+  const groupByAssignee = document.getElementById('groupByAssignee').checked;
 
-      if (response && response.success) {
-        status.className = 'success';
-        let successMessage = 'Chats created successfully!';
-        if (Array.isArray(response.result)) {
-          successMessage += '<br><br>Created chats:';
-          response.result.forEach(chat => {
-            successMessage += `<br>- ${chat.name}`;
-            if (chat.webUrl) {
-              successMessage += ` <a href="${chat.webUrl}" target="_blank">Open</a>`;
-            }
-          });
-        }
-        status.innerHTML = successMessage;
-      } else {
-        status.className = 'error';
-        status.textContent = response 
-          ? `Error: ${response.message}` 
-          : 'Failed to create chats';
-      }
-    }
-  );
+  // 以單一連線建立所有聊天，host 每完成一個聊天就回傳進度
+  createChatsFromIssues(selectedIssues, ownerEmail, memberEmails, groupByAssignee, status);
 });
 
-// 添加一個函數來處理批量創建聊天
-async function createChatsFromIssues(issues) {
-  const status = document.getElementById('status');
-  const ownerEmail = document.getElementById('ownerEmail').value;
-  const memberEmailsStr = document.getElementById('memberEmails').value;
-  const memberEmails = memberEmailsStr.split(',').map(email => email.trim());
-  
-  // 儲存當前輸入的郵件地址
-  saveEmails(ownerEmail, memberEmailsStr);
-  
-  status.style.display = 'block';
-  status.className = '';
-  
-  for (const issue of issues) {
-    status.textContent = `Creating chat for issue: ${issue.title}...`;
-    
-    try {
-      const response = await new Promise((resolve, reject) => {
-        chrome.runtime.sendNativeMessage('com.realtek.teams_chat',
-          {
-            action: "createSelectedChats",
-            selectedIssues: [{
-              title: issue.title,
-              link: issue.link,
-              key: issue.key,
-              assignee: issue.assignee,
-              assigneeEmail: issue.assigneeEmail
-            }],
-            ownerEmail: ownerEmail,
-            memberEmails: memberEmails
-          },
-          function(response) {
-            if (chrome.runtime.lastError) {
-              reject(chrome.runtime.lastError);
-            } else {
-              resolve(response);
-            }
-          }
-        );
-      });
-
-      if (response && response.success) {
-        status.className = 'success';
-        let successMessage = `Chat created for: ${issue.title}`;
-        if (response.result && response.result.webUrl) {
-          successMessage += `<br><a href="${response.result.webUrl}" target="_blank">Open in Teams</a>`;
+// 顯示最後的建立結果
+function showCreateResult(status, response) {
+  if (response && response.success) {
+    status.className = 'success';
+    let successMessage = 'Chats created successfully!';
+    if (Array.isArray(response.result)) {
+      successMessage += '<br><br>Created chats:';
+      response.result.forEach(chat => {
+        successMessage += `<br>- ${chat.name}`;
+        if (chat.webUrl) {
+          successMessage += ` <a href="${chat.webUrl}" target="_blank">Open</a>`;
         }
-        status.innerHTML = successMessage;
-        
-        // 等待一段時間再創建下一個
-        await new Promise(resolve => setTimeout(resolve, 2000));
-      } else {
-        throw new Error(response ? response.message : 'Failed to create chat');
-      }
-    } catch (error) {
-      status.className = 'error';
-      status.innerHTML = `Error creating chat for ${issue.title}: ${error.message}`;
-      // 等待一段時間後繼續
-      await new Promise(resolve => setTimeout(resolve, 2000));
+        if (chat.fallbackMembers && chat.fallbackMembers.length) {
+          successMessage += `<br>&nbsp;&nbsp;added separately: ${chat.fallbackMembers.join(', ')}`;
+        }
+        if (chat.failedMembers && chat.failedMembers.length) {
+          successMessage += `<br>&nbsp;&nbsp;failed to add: ${chat.failedMembers.join(', ')}`;
+        }
+      });
+    }
+    if (response.timedOut && response.timedOut.length) {
+      successMessage += `<br><br>Timed out (will resume next time): ${response.timedOut.join(', ')}`;
     }
+    status.innerHTML = successMessage;
+  } else {
+    status.className = 'error';
+    status.textContent = response 
+      ? `Error: ${response.message}` 
+      : 'Failed to create chats';
   }
-  
-  status.className = 'success';
-  status.textContent = 'All chats created!';
+}
+
+// 透過 connectNative 批量創建聊天：一個 host 程序處理整批 issues，並逐一回傳進度
+function createChatsFromIssues(issues, ownerEmail, memberEmails, groupByAssignee, status) {
+  const port = chrome.runtime.connectNative('com.realtek.teams_chat');
+  let finished = false;
+
+  port.onMessage.addListener(function(message) {
+    if (message.type === 'progress') {
+      const issue = issues[message.index] || {};
+      const outcome = message.success ? 'created' : (message.timedOut ? 'timed out' : 'failed');
+      const label = message.keys && message.keys.length > 1 ? message.keys.join(', ') : (issue.title || message.key);
+      status.textContent = `Creating chats... (${message.completed}/${message.total}) ${label}: ${outcome}`;
+      return;
+    }
+
+    // 最後的回應
+    finished = true;
+    port.disconnect();
+    showCreateResult(status, message);
+  });
+
+  port.onDisconnect.addListener(function() {
+    if (finished) {
+      return;
+    }
+    const error = chrome.runtime.lastError;
+    console.error('Native messaging error:', error);
+    status.className = 'error';
+    status.textContent = `Native messaging error: ${error ? error.message : 'host disconnected'}`;
+  });
+
+  port.postMessage({
+    action: 'createSelectedChats',
+    selectedIssues: issues,
+    ownerEmail,
+    memberEmails,
+    groupByAssignee,
+    stream: true
+  });
 }
 
 // 設置相關代碼
@@ -432,35 +357,6 @@ document.getElementById('saveSettings').addEventListener('click', function() {
   });
 });
 
-// 獲取 Issue 詳細資訊的函數
-async function getIssueDetails(issueKey) {
-  const credentials = await new Promise(resolve => {
-    chrome.storage.sync.get(['jiraToken', 'jiraUsername'], resolve);
-  });
-  
-  if (!credentials.jiraToken || !credentials.jiraUsername) {
-    throw new Error('Please set JIRA credentials in settings');
-  }
-  
-  const response = await fetch(`https://jira.realtek.com/rest/api/2/issue/${issueKey}`, {
-    method: 'GET',
-    headers: {
-      'Authorization': 'Basic ' + btoa(`${credentials.jiraUsername}:${credentials.jiraToken}`),
-      'Accept': 'application/json'
-    }
-  });
-  
-  if (!response.ok) {
-    throw new Error(`Failed to fetch issue details: ${response.status}`);
-  }
-  
-  const data = await response.json();
-  return {
-    assigneeEmail: data.fields.assignee?.emailAddress,
-    assigneeName: data.fields.assignee?.displayName
-  };
-}
-
 function saveEmails(ownerEmail, memberEmails) {
     if (ownerEmail || memberEmails) {  // 只要有一個有值就儲存
         chrome.storage.sync.set({
@@ -473,7 +369,7 @@ function saveEmails(ownerEmail, memberEmails) {
 }
 
 function loadSavedEmails() {
-    chrome.storage.sync.get(['lastOwnerEmail', 'lastMemberEmails'], function(result) {
+    chrome.storage.sync.get(['lastOwnerEmail', 'lastMemberEmails', 'groupByAssignee'], function(result) {
         const ownerEmailInput = document.getElementById('ownerEmail');
         const memberEmailsInput = document.getElementById('memberEmails');
         
@@ -483,5 +379,6 @@ function loadSavedEmails() {
         if (result.lastMemberEmails && !memberEmailsInput.value) {
             memberEmailsInput.value = result.lastMemberEmails;
         }
+        document.getElementById('groupByAssignee').checked = !!result.groupByAssignee;
     });
 } 
\ No newline at end of file
@@ -0,0 +1,292 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from deadline import DeadlineExceeded, current_deadline
+from metrics import metrics
+from rate_limiter import RETRYABLE_STATUS, RateLimiter, endpoint_class, is_retryable, parse_retry_after
+
+# Graph 服務位址；效能測試時可指向本機的 mock server
+GRAPH_ROOT = os.environ.get("TEAMS_CHAT_GRAPH_ROOT", "https://graph.microsoft.com").rstrip("/")
+
+# 連線與讀取逾時（秒）；避免卡住的連線讓 host 永遠等待
+CONNECT_TIMEOUT = float(os.environ.get("TEAMS_CHAT_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("TEAMS_CHAT_READ_TIMEOUT", "30"))
+
+# Graph $batch 每次最多 20 個步驟
+MAX_BATCH_STEPS = 20
+
+
+class GraphClient:
+    """共用的 Graph HTTP 用戶端，使用連線池重用 TCP/TLS 連線"""
+
+    def __init__(self, pool_maxsize=10, rate_limiter=None):
+        self.pool_maxsize = pool_maxsize
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._session = None
+        self._adapter = None
+        self._session_lock = threading.Lock()
+
+        # 每個 token 只建立一次 headers
+        self._headers_lock = threading.Lock()
+        self._headers_token = None
+        self._headers = None
+
+    @property
+    def session(self):
+        """取得（必要時建立）共用的 requests.Session"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    # 延後載入 requests，只在第一次發出請求時付出載入成本
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    adapter = HTTPAdapter(
+                        pool_connections=4,
+                        pool_maxsize=self.pool_maxsize
+                    )
+                    session = requests.Session()
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._adapter = adapter
+                    self._session = session
+        return self._session
+
+    def headers(self, access_token):
+        """依 access token 建立授權 headers，token 不變時重用"""
+        with self._headers_lock:
+            if access_token != self._headers_token:
+                self._headers = {
+                    "Authorization": f"Bearer {access_token}",
+                    "Content-Type": "application/json"
+                }
+                self._headers_token = access_token
+            return self._headers
+
+    def request(self, method, url, access_token, **kwargs):
+        """
+        透過連線池與速率限制器發送請求。
+        429/503/504 會依 Retry-After 或退避時間重試，並回報給速率限制器調整速率。
+        每次請求都有連線/讀取逾時；在 deadline_scope 內時，逾時與等待都不超過剩餘時間，
+        時間用完則拋出 DeadlineExceeded。
+        """
+        name = endpoint_class(method, url)
+        bucket = self.rate_limiter.bucket(name)
+        timeout = kwargs.pop("timeout", None) or (CONNECT_TIMEOUT, READ_TIMEOUT)
+        deadline = current_deadline()
+        attempt = 0
+        while True:
+            if deadline:
+                deadline.check()
+            waited = bucket.acquire(max_wait=deadline.remaining() if deadline else None)
+            if waited is None:
+                deadline.give_up()
+                raise DeadlineExceeded(f"Deadline exceeded while waiting for the {name} rate limit")
+            if waited:
+                metrics.record("wait.rate_limit", waited * 1000, endpoint=name)
+            with metrics.span(f"graph.{method} {name}") as span:
+                response = self.session.request(
+                    method,
+                    url,
+                    headers=self.headers(access_token),
+                    timeout=deadline.clamp(timeout) if deadline else timeout,
+                    **kwargs
+                )
+                span["status"] = response.status_code
+            if response.status_code not in RETRYABLE_STATUS:
+                bucket.on_success()
+                return response
+
+            retry_after_header = response.headers.get("Retry-After")
+            retry_after = parse_retry_after(retry_after_header)
+            bucket.on_throttle(retry_after)
+            if not is_retryable(method, response.status_code, retry_after_header):
+                # 非冪等請求可能已經執行，重送會建立重複的聊天或消息，交給呼叫端視為失敗
+                print(f"Graph returned {response.status_code} on {method} {url}, not retrying a non-idempotent request")
+                return response
+            if attempt >= self.rate_limiter.max_retries:
+                return response
+            delay = self.rate_limiter.retry_delay(attempt, retry_after)
+            if deadline and delay >= deadline.remaining():
+                deadline.give_up()
+                return response
+            print(f"Graph throttled ({response.status_code}) on {method} {url}, retrying in {delay:.1f}s")
+            with metrics.span("wait.retry", endpoint=name):
+                time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, access_token, **kwargs):
+        return self.request("GET", url, access_token, **kwargs)
+
+    def post(self, url, access_token, **kwargs):
+        return self.request("POST", url, access_token, **kwargs)
+
+    def batch(self, steps, access_token, version="beta"):
+        """
+        以單一 /$batch 請求執行多個步驟，並依步驟 id 拆回各自的回應。
+        步驟之間的順序以 dependsOn 控制。
+        """
+        if len(steps) > MAX_BATCH_STEPS:
+            raise ValueError(f"A $batch request supports at most {MAX_BATCH_STEPS} steps")
+
+        results = {}
+        pending = list(steps)
+        attempt = 0
+        while pending:
+            response = self.post(
+                f"{GRAPH_ROOT}/{version}/$batch",
+                access_token,
+                json={"requests": pending}
+            )
+            if response.status_code != 200:
+                raise GraphBatchError(response.status_code, response.text)
+
+            for item in response.json().get("responses", []):
+                results[item["id"]] = BatchResponse(
+                    item["id"],
+                    item.get("status", 0),
+                    item.get("body"),
+                    item.get("headers")
+                )
+
+            # 被節流的步驟（以及依賴它們而失敗的步驟）重新送出
+            throttled = [
+                step for step in pending
+                if results.get(step["id"]) and is_retryable(
+                    step["method"],
+                    results[step["id"]].status_code,
+                    results[step["id"]].headers.get("Retry-After")
+                )
+            ]
+            if not throttled or attempt >= self.rate_limiter.max_retries:
+                break
+            throttled_ids = {step["id"] for step in throttled}
+            retry_ids = set(throttled_ids)
+            for step in pending:
+                if results.get(step["id"]) and results[step["id"]].status_code == 424 \
+                        and set(step.get("dependsOn", [])) & retry_ids:
+                    retry_ids.add(step["id"])
+
+            retry_after = max(
+                (parse_retry_after(results[i].headers.get("Retry-After")) or 0 for i in throttled_ids),
+                default=0
+            ) or None
+            self.rate_limiter.bucket(endpoint_class("POST", f"/{version}/$batch")).on_throttle(retry_after)
+            delay = self.rate_limiter.retry_delay(attempt, retry_after)
+            deadline = current_deadline()
+            if deadline and delay >= deadline.remaining():
+                deadline.give_up()
+                break
+            with metrics.span("wait.retry", endpoint="batch"):
+                time.sleep(delay)
+            attempt += 1
+
+            pending = []
+            for step in steps:
+                if step["id"] not in retry_ids:
+                    continue
+                step = dict(step)
+                depends_on = [d for d in step.get("dependsOn", []) if d in retry_ids]
+                if depends_on:
+                    step["dependsOn"] = depends_on
+                else:
+                    step.pop("dependsOn", None)
+                pending.append(step)
+        return results
+
+    def warmup(self, access_token, connections=1):
+        """
+        同時發出 connections 個輕量的 GET /me，預先建立連線池中的 TCP/TLS 連線，
+        之後建立聊天的併發請求可直接重用。回傳各請求的 HTTP 狀態碼。
+        """
+        url = f"{GRAPH_ROOT}/v1.0/me"
+        connections = max(1, min(connections, self.pool_maxsize))
+
+        def probe(_):
+            return self.get(url, access_token, params={"$select": "id"}).status_code
+
+        if connections == 1:
+            return [probe(0)]
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            return list(executor.map(probe, range(connections)))
+
+    def connection_stats(self):
+        """回傳連線重用統計：請求數、新建連線數與重用次數"""
+        opened = 0
+        served = 0
+        if self._adapter is not None:
+            pools = self._adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                opened += pool.num_connections
+                served += pool.num_requests
+        return {
+            "requests": served,
+            "connections_opened": opened,
+            "connections_reused": max(served - opened, 0)
+        }
+
+    def close(self):
+        """關閉連線池"""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._adapter = None
+
+
+class GraphBatchError(Exception):
+    """整個 $batch 請求失敗"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"$batch request failed: {status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+class BatchResponse:
+    """$batch 中單一步驟的回應，介面與 requests.Response 相近"""
+
+    def __init__(self, step_id, status_code, body=None, headers=None):
+        self.id = step_id
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    @property
+    def ok(self):
+        return 200 <= self.status_code < 300
+
+    @property
+    def text(self):
+        if self.body is None:
+            return ""
+        if isinstance(self.body, str):
+            return self.body
+        return json.dumps(self.body)
+
+    def json(self):
+        return self.body if self.body is not None else {}
+
+    def __repr__(self):
+        return f"BatchResponse(id={self.id!r}, status_code={self.status_code})"
+
+
+def batch_step(step_id, method, url, body=None, depends_on=None):
+    """建立一個 $batch 步驟；url 為相對於版本根目錄的路徑，例如 /chats/{id}/messages"""
+    step = {
+        "id": str(step_id),
+        "method": method,
+        "url": url
+    }
+    if body is not None:
+        step["body"] = body
+        step["headers"] = {"Content-Type": "application/json"}
+    if depends_on:
+        step["dependsOn"] = [str(d) for d in depends_on]
+    return step
@@ -0,0 +1,129 @@
+"""
+host 與常駐程式共用的日誌設定。
+
+記錄都先放進佇列，由背景的 QueueListener 寫入檔案（依大小輪替）與 stderr，
+處理訊息的執行緒不會被檔案 I/O 擋住。
+
+常駐程式寫入自己的日誌檔（DAEMON_LOG_FILE），只有它會輪替該檔；
+host 程序可能同時有好幾個，輪替失敗（Windows 上檔案被其他程序開啟）時繼續寫入原檔。
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+LOG_FILE = os.environ.get(
+    'TEAMS_CHAT_LOG_FILE',
+    os.path.join(os.path.expanduser('~'), 'teams_chat_native_host.log')
+)
+
+# 常駐程式的日誌檔（預設為 LOG_FILE 加上 _daemon）
+DAEMON_LOG_FILE = os.environ.get(
+    'TEAMS_CHAT_DAEMON_LOG_FILE',
+    os.path.splitext(LOG_FILE)[0] + '_daemon' + (os.path.splitext(LOG_FILE)[1] or '.log')
+)
+
+# 日誌等級（DEBUG/INFO/WARNING/ERROR）
+LOG_LEVEL = os.environ.get('TEAMS_CHAT_LOG_LEVEL', 'INFO').upper()
+
+# 單一日誌檔大小上限與保留的舊檔數
+LOG_MAX_BYTES = int(os.environ.get('TEAMS_CHAT_LOG_MAX_BYTES', str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get('TEAMS_CHAT_LOG_BACKUPS', '3'))
+
+# 摘要中字串保留的長度
+SUMMARY_TEXT_LIMIT = 80
+
+# 不寫入日誌的欄位
+SECRET_KEYS = ('jiraToken', 'token', 'secret', 'access_token')
+
+# 輪替失敗後，多久之後再嘗試（秒）
+ROLLOVER_RETRY = 60
+
+_listener = None
+
+
+class SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    可能有其他程序同時開啟同一檔案的 RotatingFileHandler。
+    改名失敗時不丟出錯誤，繼續附加到原檔，ROLLOVER_RETRY 秒後再嘗試輪替。
+    """
+
+    _retry_at = 0.0
+
+    def shouldRollover(self, record):
+        if time.monotonic() < self._retry_at:
+            return False
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        try:
+            super().doRollover()
+        except OSError:
+            self._retry_at = time.monotonic() + ROLLOVER_RETRY
+            if self.stream is None or self.stream.closed:
+                self.stream = self._open()
+
+
+def setup_logging(log_file=None):
+    """設定佇列式日誌（重複呼叫不會重複設定）；log_file 預設為 LOG_FILE"""
+    global _listener
+    log_file = log_file or LOG_FILE
+    if _listener is not None:
+        return
+    level = getattr(logging, LOG_LEVEL, logging.INFO)
+    formatter = logging.Formatter('%(asctime)s - %(process)d - %(levelname)s - %(message)s')
+
+    handlers = []
+    try:
+        file_handler = SharedRotatingFileHandler(
+            log_file,
+            maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT,
+            encoding='utf-8',
+            delay=True
+        )
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    except Exception as e:
+        print(f"Error setting up log file {log_file}: {str(e)}", file=sys.stderr)
+
+    # stderr 會被 Chrome 收集，只輸出警告以上
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(formatter)
+    console.setLevel(max(level, logging.WARNING))
+    handlers.append(console)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # 結束時把佇列中剩下的記錄寫完
+    atexit.register(_listener.stop)
+
+
+def summarize(value, depth=0):
+    """
+    產生適合寫入日誌的摘要：隱藏 token，長字串截斷，list 只記錄數量與第一筆的摘要。
+    """
+    if isinstance(value, dict):
+        if depth >= 3:
+            return f'<dict {len(value)} keys>'
+        return {
+            key: '***' if key in SECRET_KEYS else summarize(item, depth + 1)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return []
+        if len(value) == 1:
+            return [summarize(value[0], depth + 1)]
+        return f'<{len(value)} items, first: {summarize(value[0], depth + 1)}>'
+    if isinstance(value, str) and len(value) > SUMMARY_TEXT_LIMIT:
+        return f'{value[:SUMMARY_TEXT_LIMIT]}...<{len(value)} chars>'
+    return value
@@ -0,0 +1,92 @@
+"""
+Chrome native messaging 的 frame 編解碼。
+
+每個 frame 是 4 bytes（原生位元組順序）的長度，接著是 UTF-8 JSON。
+stdin/stdout 與常駐程式的 socket 都使用同一套編解碼。
+"""
+import json
+import struct
+import sys
+import threading
+
+# Chrome 傳給 host 的訊息上限為 4 GB，這裡限制為較合理的大小
+MAX_INCOMING_SIZE = 64 * 1024 * 1024
+# host 傳給 Chrome 的訊息上限為 1 MB
+MAX_OUTGOING_SIZE = 1024 * 1024
+
+_HEADER = struct.Struct('=I')
+
+
+class FrameError(Exception):
+    """frame 格式錯誤、被截斷或超過大小限制"""
+
+
+class MessageCodec:
+    """在緩衝的 binary stream 上讀寫長度前綴的 JSON frame"""
+
+    def __init__(self, reader, writer, max_incoming=MAX_INCOMING_SIZE, max_outgoing=MAX_OUTGOING_SIZE):
+        self.reader = reader
+        self.writer = writer
+        self.max_incoming = max_incoming
+        self.max_outgoing = max_outgoing
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def for_stdio(cls, **kwargs):
+        """
+        使用 stdin/stdout 建立 codec。
+        stdout 保留給 frame 使用，之後的 print 一律導向 stderr，避免破壞 frame。
+        """
+        codec = cls(sys.stdin.buffer, sys.stdout.buffer, **kwargs)
+        sys.stdout = sys.stderr
+        return codec
+
+    def _read_exact(self, size):
+        """讀取剛好 size bytes，處理 short read；一開始就 EOF 時回傳 None"""
+        chunks = []
+        remaining = size
+        while remaining:
+            chunk = self.reader.read(remaining)
+            if not chunk:
+                if remaining == size:
+                    return None
+                raise FrameError(f"Truncated frame: expected {size} bytes, got {size - remaining}")
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b''.join(chunks)
+
+    def read_raw(self):
+        """讀取一個 frame 的原始 bytes；stream 結束時回傳 None"""
+        header = self._read_exact(_HEADER.size)
+        if header is None:
+            return None
+        length = _HEADER.unpack(header)[0]
+        if length > self.max_incoming:
+            raise FrameError(f"Incoming frame of {length} bytes exceeds limit of {self.max_incoming}")
+        payload = self._read_exact(length)
+        if payload is None:
+            raise FrameError("Truncated frame: missing payload")
+        return payload
+
+    def read(self):
+        """讀取並解析一個 JSON frame；stream 結束時回傳 None"""
+        payload = self.read_raw()
+        if payload is None:
+            return None
+        return json.loads(payload.decode('utf-8'))
+
+    def write_raw(self, payload):
+        """寫入一個 frame（可由多個執行緒呼叫）"""
+        if len(payload) > self.max_outgoing:
+            raise FrameError(f"Outgoing frame of {len(payload)} bytes exceeds limit of {self.max_outgoing}")
+        with self._write_lock:
+            self.writer.write(_HEADER.pack(len(payload)) + payload)
+            self.writer.flush()
+
+    def write(self, message):
+        self.write_raw(json.dumps(message).encode('utf-8'))
+
+
+def is_progress_frame(message):
+    """串流模式下的中間 frame；最後的回應不帶 type=progress"""
+    return isinstance(message, dict) and message.get('type') == 'progress'
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+"""
+常駐的 Teams chat 服務程式。
+
+Chrome 每次 sendNativeMessage 都會啟動新的 teams_chat_host.py；
+teams_chat_host.py 只負責把訊息轉送到這個常駐程式，
+token、MSAL 應用與 Graph 連線池都留在這裡重複使用。
+"""
+import json
+import logging
+import os
+import secrets
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from file_lock import FileLock, atomic_write_text
+from host_logging import DAEMON_LOG_FILE, setup_logging
+from native_messaging import MAX_INCOMING_SIZE, FrameError, MessageCodec, is_progress_frame
+
+ENDPOINT_FILE = os.path.join(os.path.expanduser('~'), '.teams_chat_daemon.json')
+SOCKET_PATH = os.path.join(os.path.expanduser('~'), '.teams_chat_daemon.sock')
+
+# 閒置多久後自動結束（秒）
+IDLE_TIMEOUT = float(os.environ.get('TEAMS_CHAT_DAEMON_IDLE', '1800'))
+
+
+def daemon_enabled():
+    """TEAMS_CHAT_DAEMON=off 時停用常駐程式，所有訊息在 host 程序內處理"""
+    return os.environ.get('TEAMS_CHAT_DAEMON', 'on').lower() not in ('0', 'off', 'false', 'no')
+
+
+def _socket_codec(rfile, wfile):
+    # socket 兩端都是本機程序，回應大小限制交給面向 Chrome 的 stdout codec
+    return MessageCodec(rfile, wfile, max_incoming=MAX_INCOMING_SIZE, max_outgoing=MAX_INCOMING_SIZE)
+
+
+# ---- 用戶端（teams_chat_host.py 使用） ----
+
+class DaemonConnection:
+    """到常駐程式的連線"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+        self.wfile = sock.makefile('wb')
+        self.codec = _socket_codec(self.rfile, self.wfile)
+
+    def forward(self, payload, relay):
+        """
+        轉送一個請求 frame，並把常駐程式的回應 frame（原始 bytes）交給 relay。
+        串流模式下會先收到多個 progress frame，直到最後的回應為止。
+        """
+        self.codec.write_raw(payload)
+        while True:
+            response = self.codec.read_raw()
+            if response is None:
+                raise ConnectionError("Daemon closed the connection")
+            relay(response)
+            if not is_progress_frame(json.loads(response.decode('utf-8'))):
+                return
+
+    def close(self):
+        for f in (self.rfile, self.wfile, self.sock):
+            try:
+                f.close()
+            except OSError:
+                pass
+
+
+def connect(timeout=1.0):
+    """連線到常駐程式並完成驗證；無法連線時回傳 None"""
+    try:
+        with open(ENDPOINT_FILE, 'r', encoding='utf-8') as f:
+            endpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        if endpoint.get('family') == 'unix':
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address = endpoint['path']
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            address = ('127.0.0.1', endpoint['port'])
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.settimeout(None)
+    except (OSError, KeyError):
+        return None
+
+    connection = DaemonConnection(sock)
+    try:
+        connection.codec.write({'secret': endpoint.get('secret')})
+    except OSError:
+        connection.close()
+        return None
+    return connection
+
+
+def start_in_background():
+    """在背景啟動常駐程式，不等待它就緒"""
+    args = [sys.executable, os.path.abspath(__file__)]
+    kwargs = {
+        'stdin': subprocess.DEVNULL,
+        'stdout': subprocess.DEVNULL,
+        'stderr': subprocess.DEVNULL,
+        'close_fds': True,
+        'cwd': current_dir
+    }
+    if os.name == 'nt':
+        # Chrome 結束 host 時會一併結束同一個 job 內的程序，因此需要脫離 job
+        flags = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        try:
+            return subprocess.Popen(args, creationflags=flags | 0x01000000, **kwargs)
+        except OSError:
+            return subprocess.Popen(args, creationflags=flags, **kwargs)
+    return subprocess.Popen(args, start_new_session=True, **kwargs)
+
+
+# ---- 伺服器 ----
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        server.active += 1
+        codec = _socket_codec(self.rfile, self.wfile)
+        try:
+            hello = codec.read()
+            if not hello or not secrets.compare_digest(str(hello.get('secret')), server.secret):
+                logging.warning('Rejected daemon connection with invalid secret')
+                return
+            while True:
+                message = codec.read()
+                if message is None:
+                    break
+                server.last_activity = time.monotonic()
+                response = server.handle_message(message, send_progress=codec.write)
+                codec.write(response)
+                server.last_activity = time.monotonic()
+        except (OSError, ValueError, FrameError) as e:
+            logging.warning(f'Daemon connection error: {str(e)}')
+        finally:
+            server.active -= 1
+
+
+def _make_server():
+    if hasattr(socket, 'AF_UNIX'):
+        if os.path.exists(SOCKET_PATH):
+            os.remove(SOCKET_PATH)
+        server = socketserver.ThreadingUnixStreamServer(SOCKET_PATH, _RequestHandler)
+        os.chmod(SOCKET_PATH, 0o600)
+        endpoint = {'family': 'unix', 'path': SOCKET_PATH}
+    else:
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _RequestHandler)
+        endpoint = {'family': 'tcp', 'port': server.server_address[1]}
+    server.daemon_threads = True
+    return server, endpoint
+
+
+def _idle_watchdog(server, idle_timeout):
+    while True:
+        time.sleep(min(idle_timeout, 30))
+        if server.active == 0 and time.monotonic() - server.last_activity > idle_timeout:
+            logging.info('Daemon idle, shutting down')
+            server.shutdown()
+            return
+
+
+def _resume_jobs(server):
+    import create_teams_chat
+    # 接手期間不因閒置而結束
+    server.active += 1
+    try:
+        resumed = create_teams_chat.resume_interrupted_jobs()
+        if resumed:
+            logging.info(f'Resumed {len(resumed)} interrupted chat jobs')
+    except Exception as e:
+        logging.warning(f'Resuming jobs failed: {str(e)}')
+    finally:
+        server.active -= 1
+        server.last_activity = time.monotonic()
+
+
+def serve(idle_timeout=IDLE_TIMEOUT):
+    """啟動常駐程式；已有其他常駐程式在執行時直接結束"""
+    instance_lock = FileLock(ENDPOINT_FILE, timeout=0)
+    try:
+        instance_lock.acquire()
+    except TimeoutError:
+        logging.info('Another daemon is already running')
+        return
+
+    try:
+        import teams_chat_host
+        import create_teams_chat
+
+        server, endpoint = _make_server()
+        server.secret = secrets.token_hex(16)
+        server.handle_message = teams_chat_host.handle_message
+        server.active = 0
+        server.last_activity = time.monotonic()
+
+        endpoint['secret'] = server.secret
+        endpoint['pid'] = os.getpid()
+        atomic_write_text(ENDPOINT_FILE, json.dumps(endpoint))
+        logging.info(f'Daemon listening: {endpoint["family"]} (pid {os.getpid()})')
+
+        # 預先載入 msal/requests，並建立 TokenManager 與連線池
+        try:
+            create_teams_chat.preload()
+        except Exception as e:
+            logging.warning(f'Preload failed: {str(e)}')
+
+        # 接手先前程序中斷時未完成的建立聊天工作
+        threading.Thread(target=_resume_jobs, args=(server,), daemon=True).start()
+        
+        # 收到 SIGTERM 時正常結束，清除 socket 與端點檔
+        signal.signal(
+            signal.SIGTERM,
+            lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start()
+        )
+        threading.Thread(
+            target=_idle_watchdog,
+            args=(server, idle_timeout),
+            daemon=True
+        ).start()
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if endpoint['family'] == 'unix' and os.path.exists(SOCKET_PATH):
+                os.remove(SOCKET_PATH)
+            if os.path.exists(ENDPOINT_FILE):
+                os.remove(ENDPOINT_FILE)
+    except Exception as e:
+        logging.error(f'Daemon failed: {str(e)}')
+        logging.error(traceback.format_exc())
+    finally:
+        instance_lock.release()
+
+
+if __name__ == '__main__':
+    # 常駐程式使用自己的日誌檔，避免與同時執行的 host 程序輪替同一個檔案
+    setup_logging(DAEMON_LOG_FILE)
+    serve()
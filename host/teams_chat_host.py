@@ -1,54 +1,43 @@
 #!/usr/bin/env python
 import sys
 import json
-import struct
 import os
 import logging
-import traceback
 import time
+import traceback
 
 # 添加父目錄到 Python 路徑
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
-# 現在可以導入 create_teams_chat
-import create_teams_chat
+# create_teams_chat（requests/msal）延後到真正需要時才載入；
+# 常駐程式可用時，這個程序只負責轉送訊息
+import teams_chat_daemon
+from chat_jobs import build_chat_job, build_group_jobs
+from host_logging import setup_logging, summarize
+from native_messaging import FrameError, MessageCodec, is_progress_frame
 
-# 設置日誌
-try:
-    log_path = os.path.join(os.path.expanduser('~'), 'teams_chat_native_host.log')
-    print(f"Attempting to create log file at: {log_path}", file=sys.stderr)
-    
-    logging.basicConfig(
-        filename=log_path,
-        level=logging.DEBUG,
-        format='%(asctime)s - %(levelname)s - %(message)s'
-    )
-    
-    # 同時輸出到 stderr
-    console = logging.StreamHandler(sys.stderr)
-    console.setLevel(logging.DEBUG)
-    logging.getLogger('').addHandler(console)
-    
-    logging.info('Logging initialized successfully')
-except Exception as e:
-    print(f"Error setting up logging: {str(e)}", file=sys.stderr)
-    print(f"Traceback: {traceback.format_exc()}", file=sys.stderr)
+# 設置日誌（佇列式，檔案寫入在背景執行緒進行）
+setup_logging()
 
 # Native messaging protocol helper functions
+_codec = None
+
+def stdio_codec():
+    """stdin/stdout 的 frame 編解碼（第一次使用時建立，之後 print 會導向 stderr）"""
+    global _codec
+    if _codec is None:
+        _codec = MessageCodec.for_stdio()
+    return _codec
+
 def get_message():
     try:
         logging.debug("Waiting for message...")
-        raw_length = sys.stdin.buffer.read(4)
-        if not raw_length:
+        message = stdio_codec().read()
+        if message is None:
             logging.warning("No message length received")
-            return None
-        message_length = struct.unpack('=I', raw_length)[0]
-        logging.debug(f"Message length: {message_length}")
-        message = sys.stdin.buffer.read(message_length).decode('utf-8')
-        logging.debug(f"Received message: {message}")
-        return json.loads(message)
+        return message
     except Exception as e:
         logging.error(f"Error in get_message: {str(e)}")
         logging.error(traceback.format_exc())
@@ -56,56 +45,152 @@ def get_message():
 
 def send_message(message):
     try:
-        logging.debug(f"Sending message: {message}")
-        encoded_message = json.dumps(message).encode('utf-8')
-        encoded_length = struct.pack('=I', len(encoded_message))
-        sys.stdout.buffer.write(encoded_length)
-        sys.stdout.buffer.write(encoded_message)
-        sys.stdout.buffer.flush()
+        stdio_codec().write(message)
         logging.debug("Message sent successfully")
+    except FrameError as e:
+        # 回應超過 Chrome 的大小限制時改送錯誤訊息
+        logging.error(f"Error in send_message: {str(e)}")
+        stdio_codec().write({'success': False, 'message': str(e)})
     except Exception as e:
         logging.error(f"Error in send_message: {str(e)}")
         logging.error(traceback.format_exc())
 
-def sanitize_chat_name(title):
-    """清理聊天名稱以符合 Teams 的要求"""
-    # 1. 移除開頭和結尾的空白
-    title = title.strip()
-    
-    # 2. 移除不允許的特殊字元
-    # Teams 不允許: <>*%&:{}?+/\|"#
-    invalid_chars = '<>*%&:{}?+/\\|"#'
-    for char in invalid_chars:
-        title = title.replace(char, '-')
+def handle_message(message, send_progress=None):
+    """
+    處理來自擴充功能的消息。
+    message 帶有 stream=True 且提供 send_progress 時，每完成一個 issue 就送出一個 progress frame。
+    """
+    try:
+        action = message.get('action')
+        logging.info(f'Processing message: {summarize(message)}')
         
-    # 3. 將多個空白替換為單個空白
-    title = ' '.join(title.split())
-    
-    # 4. 限制長度為 250 字元
-    if len(title) > 250:
-        title = title[:247] + '...'
+        if action == 'ping':
+            # 用於檢查 host 狀態與量測啟動時間；warm=True 時載入 requests/msal
+            if message.get('warm'):
+                import create_teams_chat
+                create_teams_chat.preload()
+            return {
+                'success': True,
+                'pid': os.getpid(),
+                'modules': sorted(m for m in ('requests', 'msal') if m in sys.modules)
+            }
         
-    # 5. 確保不是空字串
-    if not title:
-        title = 'New Chat'
+        if action == 'warmup':
+            # popup 開啟時送出：先取得 token 並建立 Graph（以及 JIRA）連線，
+            # 讓第一次建立聊天不必在關鍵路徑上等待登入與 TLS 交握
+            import create_teams_chat
+            started = time.perf_counter()
+            timings = create_teams_chat.warmup(message.get('concurrency'))
+            username = message.get('jiraUsername')
+            token = message.get('jiraToken')
+            if username and token:
+                import jira_issues
+                jira_started = time.perf_counter()
+                try:
+                    timings['jiraStatus'] = jira_issues.get_client(username, token).warmup()
+                except Exception as e:
+                    logging.warning(f'JIRA warmup failed: {str(e)}')
+                    timings['jiraError'] = str(e)
+                timings['jiraMs'] = round((time.perf_counter() - jira_started) * 1000, 1)
+            timings['totalMs'] = round((time.perf_counter() - started) * 1000, 1)
+            logging.info(f'Warmup finished: {timings}')
+            return {
+                'success': True,
+                'result': timings
+            }
         
-    return title
-
-def handle_message(message):
-    """處理來自擴充功能的消息"""
-    try:
-        action = message.get('action')
-        logging.info(f'Processing message: {message}')
+        if action == 'getStats':
+            # 各步驟的延遲統計（p50/p95/p99），常駐程式中會累積多次請求
+            import create_teams_chat
+            from metrics import metrics
+            job_queue = create_teams_chat.get_job_queue()
+            stats = {
+                'spans': metrics.snapshot(),
+                'connections': create_teams_chat.graph_client.connection_stats(),
+                'rateLimiter': create_teams_chat.graph_client.rate_limiter.stats(),
+                'jobs': job_queue.counts() if job_queue else {},
+                'traceFile': metrics.trace_file
+            }
+            if message.get('reset'):
+                metrics.reset()
+            return {
+                'success': True,
+                'result': stats
+            }
+        
+        if action == 'resumeJobs':
+            # 接手先前中斷（Chrome 關閉連線、程序結束）的建立聊天工作
+            import create_teams_chat
+            resumed = create_teams_chat.resume_interrupted_jobs(message.get('concurrency'))
+            results = [result for _, result in resumed if create_teams_chat.chat_succeeded(result)]
+            logging.info(f'Resumed {len(resumed)} interrupted jobs, {len(results)} succeeded')
+            return {
+                'success': True,
+                'resumed': len(resumed),
+                'result': results
+            }
+        
+        if action == 'fetchFilteredIssues':
+            import jira_issues
+            
+            xml_url = message.get('jiraXmlUrl')
+            username = message.get('jiraUsername')
+            token = message.get('jiraToken')
+            if not xml_url and not message.get('jql'):
+                raise Exception("JIRA XML URL is required")
+            if not username or not token:
+                raise Exception("Please set JIRA credentials in settings")
+            
+            # search/sync 模式：以分頁 JQL 搜尋一次取得 assignee 與評論
+            mode = message.get('mode')
+            jql = message.get('jql')
+            if not jql and mode in ('search', 'sync'):
+                jql = jira_issues.filter_jql_from_xml_url(xml_url)
+            
+            if jql and mode == 'sync':
+                # sync 模式：只重新抓取 updated 有變更的 issue，篩選改由本機索引查詢
+                import jira_store
+                logging.info(f'Syncing issues with JQL: {jql}')
+                issues = jira_store.sync_filtered_issues(
+                    jira_store.get_issue_store(),
+                    jql,
+                    username,
+                    token,
+                    message.get('targetUsers', ''),
+                    message.get('commentHours', 18)
+                )
+            elif jql:
+                logging.info(f'Searching issues with JQL: {jql}')
+                issues = jira_issues.search_filtered_issues(
+                    jql,
+                    username,
+                    token,
+                    message.get('targetUsers', ''),
+                    message.get('commentHours', 18)
+                )
+            else:
+                issues = jira_issues.fetch_filtered_issues(
+                    xml_url,
+                    username,
+                    token,
+                    message.get('targetUsers', ''),
+                    message.get('commentHours', 18),
+                    max_workers=message.get('concurrency') or jira_issues.DEFAULT_MAX_WORKERS
+                )
+            logging.info(f'Found {len(issues)} matching issues')
+            return {
+                'success': True,
+                'result': issues
+            }
         
         if action == 'createSelectedChats':
+            import create_teams_chat
+            
             selected_issues = message.get('selectedIssues', [])
             owner_email = message.get('ownerEmail')
             member_emails = message.get('memberEmails', [])
             
-            logging.info(f'Creating chats for {len(selected_issues)} issues')
-            logging.info(f'Selected issues: {selected_issues}')
-            logging.info(f'Owner email: {owner_email}')
-            logging.info(f'Member emails: {member_emails}')
+            logging.info(f'Creating chats for {len(selected_issues)} issues, owner {owner_email}, {len(member_emails)} members')
             
             if not selected_issues:
                 raise Exception("No issues selected")
@@ -116,70 +201,74 @@ def handle_message(message):
             if not member_emails:
                 raise Exception("Member emails are required")
             
+            if message.get('groupByAssignee'):
+                # 同一 assignee 的 issues 共用一個聊天，成員加入與問候只做一次
+                grouped = build_group_jobs(selected_issues, owner_email, member_emails)
+            else:
+                grouped = [
+                    (build_chat_job(issue, owner_email, member_emails), [index])
+                    for index, issue in enumerate(selected_issues)
+                ]
+            chat_jobs = [job for job, _ in grouped]
+            job_issues = [[selected_issues[i] for i in indexes] for _, indexes in grouped]
+            concurrency = message.get('concurrency') or create_teams_chat.DEFAULT_CONCURRENCY
+            logging.info(f'Running {len(chat_jobs)} chat jobs with concurrency {concurrency}')
+            
+            on_result = None
+            if message.get('stream') and send_progress:
+                completed = []
+                
+                def report_progress(index, result):
+                    completed.append(index)
+                    issues = job_issues[index]
+                    send_progress({
+                        'type': 'progress',
+                        'index': grouped[index][1][0],
+                        'key': issues[0].get('key'),
+                        'keys': [issue.get('key') for issue in issues],
+                        'completed': len(completed),
+                        'total': len(chat_jobs),
+                        'success': create_teams_chat.chat_succeeded(result),
+                        'timedOut': bool(result and result.get('timedOut')),
+                        'result': result
+                    })
+                
+                on_result = report_progress
+            
+            chat_results = create_teams_chat.create_chats_concurrently(
+                chat_jobs,
+                max_workers=concurrency,
+                on_result=on_result
+            )
+            
             results = []
-            for issue in selected_issues:
-                try:
-                    chat_name = sanitize_chat_name(issue['title'])
-                    issue_link = issue.get('link')
-                    issue_key = issue.get('key')
-                    issue_title = issue.get('title')
-                    assignee = issue.get('assignee')
-                    assignee_email = issue.get('assigneeEmail')
-                    
-                    logging.info('=== Processing issue ===')
-                    logging.info(f'Chat name: {chat_name}')
-                    logging.info(f'Issue link: {issue_link}')
-                    logging.info(f'Issue key: {issue_key}')
-                    logging.info(f'Issue title: {issue_title}')
-                    logging.info(f'Assignee: {assignee}')
-                    logging.info(f'Assignee email: {assignee_email}')
-                    
-                    # 如果有 assignee email，添加到成員列表
-                    chat_members = member_emails.copy()
-                    if assignee_email and assignee_email not in chat_members:
-                        chat_members.append(assignee_email)
-                        logging.info(f'Added assignee to members: {assignee_email}')
-                    
-                    logging.info(f'Final member list: {chat_members}')
-                    
-                    try:
-                        result = create_teams_chat.main(
-                            chat_name=chat_name,
-                            owner_email=owner_email,
-                            member_emails=chat_members,
-                            issue_link=issue_link,
-                            issue_key=issue_key,
-                            issue_title=issue_title,
-                            assignee=assignee,
-                            assignee_email=assignee_email
-                        )
-                        logging.info(f'Chat creation result: {result}')
-                    except Exception as e:
-                        logging.error(f'Error in create_teams_chat.main: {str(e)}')
-                        logging.error(traceback.format_exc())
-                        raise
-                    
-                    if result:
-                        logging.info(f'Chat created successfully: {result}')
-                        results.append(result)
-                    else:
-                        logging.error('Failed to create chat')
-                        
-                    time.sleep(2)
-                except Exception as e:
-                    logging.error(f"Error creating chat for {issue['title']}: {str(e)}")
-                    logging.error(traceback.format_exc())
-                    continue
+            timed_out = []
+            for job, issues, result in zip(chat_jobs, job_issues, chat_results):
+                if result and result.get('timedOut'):
+                    logging.error(f"Timed out creating chat for {job.get('issue_key')}: {result['message']}")
+                    timed_out.extend(issue.get('key') for issue in issues)
+                elif result:
+                    logging.info(f"Chat created for {job.get('issue_key')}: {result.get('id')}")
+                    if result.get('fallbackMembers'):
+                        logging.warning(f"Members added via fallback: {result['fallbackMembers']}")
+                    if result.get('failedMembers'):
+                        logging.error(f"Members that could not be added: {result['failedMembers']}")
+                    results.append(result)
+                else:
+                    logging.error(f"Failed to create chat for {job.get('chat_name')}")
             
             if not results:
+                if timed_out:
+                    raise Exception(f"Timed out creating chats for: {', '.join(timed_out)}")
                 raise Exception("Failed to create any chats")
             
             response = {
                 'success': True,
                 'message': 'Chats created successfully',
-                'result': results
+                'result': results,
+                'timedOut': timed_out
             }
-            logging.info(f'Sending response: {response}')
+            logging.info(f'Created {len(results)} of {len(chat_jobs)} chats for {len(selected_issues)} issues')
             return response
             
         else:
@@ -194,21 +283,74 @@ def handle_message(message):
             'message': error_msg
         }
 
+def forward_to_daemon():
+    """
+    將所有訊息轉送到常駐程式。
+    回傳 False 表示無法連線，呼叫端需自行處理訊息。
+    """
+    connection = teams_chat_daemon.connect()
+    if connection is None:
+        return False
+    
+    logging.info('Forwarding messages to daemon')
+    codec = stdio_codec()
+    try:
+        while True:
+            payload = codec.read_raw()
+            if payload is None:
+                logging.info('No message received, exiting')
+                return True
+            relayed = []
+            
+            def relay(frame):
+                relayed.append(len(frame))
+                try:
+                    codec.write_raw(frame)
+                except FrameError as e:
+                    # 超過 Chrome 的大小限制：訊息已由常駐程式處理，不可在本程序重做，
+                    # 最後的回應改送錯誤訊息，progress frame 直接略過
+                    logging.error(f'Error relaying daemon response: {str(e)}')
+                    if not is_progress_frame(json.loads(frame.decode('utf-8'))):
+                        codec.write({'success': False, 'message': str(e)})
+            
+            try:
+                connection.forward(payload, relay)
+            except (OSError, ConnectionError, FrameError) as e:
+                logging.warning(f'Daemon connection lost: {str(e)}')
+                if relayed:
+                    # 已經有部分進度送出，避免重複建立聊天
+                    send_message({'success': False, 'message': f'Daemon connection lost: {str(e)}'})
+                    return True
+                # 常駐程式中途結束，改在本程序處理
+                message = json.loads(payload.decode('utf-8'))
+                send_message(handle_message(message, send_progress=send_message))
+                break
+    finally:
+        connection.close()
+    return False
+
 def main():
     try:
         logging.info('Native messaging host started')
+        if teams_chat_daemon.daemon_enabled():
+            if forward_to_daemon():
+                return
+            # 此次在本程序處理，同時啟動常駐程式供下次使用
+            try:
+                teams_chat_daemon.start_in_background()
+            except Exception as e:
+                logging.warning(f'Failed to start daemon: {str(e)}')
+        
         while True:
             message = get_message()
             if message is None:
                 logging.info('No message received, exiting')
                 break
                 
-            logging.info(f'Processing message: {message}')
-            
-            # 使用新的消息處理函數
-            response = handle_message(message)
+            # 使用新的消息處理函數；串流模式下每完成一個 issue 就送出 progress frame
+            response = handle_message(message, send_progress=send_message)
             
-            logging.info(f'Sending response: {response}')
+            logging.debug('Sending response: %s', summarize(response))
             send_message(response)
             
     except Exception as e:
@@ -1,7 +1,5 @@
 #!/usr/bin/env python
 import sys
-import json
-import struct
 import logging
 import os
 import traceback
@@ -15,6 +13,7 @@ sys.path.append(parent_dir)
 
 # 導入 create_teams_chat
 import create_teams_chat
+from native_messaging import MessageCodec
 
 def is_admin():
     try:
@@ -46,23 +45,17 @@ logging.info(f'Current working directory: {os.getcwd()}')
 logging.info(f'Python executable: {sys.executable}')
 logging.info(f'Command line arguments: {sys.argv}')
 
+# 與 teams_chat_host.py 共用 frame 編解碼
+codec = MessageCodec.for_stdio()
+
 def get_message():
     try:
-        # 讀取消息長度（4 bytes）
-        raw_length = sys.stdin.buffer.read(4)
-        if not raw_length:
+        message = codec.read()
+        if message is None:
             logging.warning('No message length received')
             return None
-            
-        # 解析消息長度
-        message_length = struct.unpack('=I', raw_length)[0]
-        logging.info(f'Expected message length: {message_length}')
-        
-        # 讀取實際消息
-        message = sys.stdin.buffer.read(message_length).decode('utf-8')
         logging.info(f'Received message: {message}')
-        
-        return json.loads(message)
+        return message
     except Exception as e:
         logging.error(f'Error in get_message: {str(e)}')
         logging.error(traceback.format_exc())
@@ -70,20 +63,7 @@ def get_message():
 
 def send_message(message):
     try:
-        # 將消息轉換為 JSON 並編碼
-        encoded_content = json.dumps(message).encode('utf-8')
-        
-        # 準備長度資訊
-        encoded_length = struct.pack('=I', len(encoded_content))
-        
-        # 寫入長度
-        sys.stdout.buffer.write(encoded_length)
-        sys.stdout.buffer.flush()
-        
-        # 寫入消息內容
-        sys.stdout.buffer.write(encoded_content)
-        sys.stdout.buffer.flush()
-        
+        codec.write(message)
         logging.info(f'Sent message: {message}')
     except Exception as e:
         logging.error(f'Error in send_message: {str(e)}')
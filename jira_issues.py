@@ -0,0 +1,288 @@
+import re
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+JIRA_BASE_URL = "https://jira.realtek.com"
+
+# JIRA 請求的 (連線, 讀取) 逾時秒數
+JIRA_TIMEOUT = (5, 60)
+
+# 同時向 JIRA 發出的請求數
+DEFAULT_MAX_WORKERS = 8
+
+# /rest/api/2/search 每頁筆數
+SEARCH_PAGE_SIZE = 100
+
+# search 模式需要的欄位
+SEARCH_FIELDS = 'summary,assignee,comment'
+
+# 回傳給擴充功能的評論內容長度上限（native messaging 回應上限為 1 MB）
+MAX_COMMENT_BODY = 1000
+
+
+class JiraError(Exception):
+    """JIRA 回傳錯誤"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class JiraClient:
+    """使用連線池與 Basic 驗證的 JIRA REST 用戶端"""
+
+    def __init__(self, username, token, base_url=JIRA_BASE_URL, pool_maxsize=DEFAULT_MAX_WORKERS):
+        self.username = username
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.pool_maxsize = pool_maxsize
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    session.auth = (self.username, self.token)
+                    session.headers.update({'Accept': 'application/json'})
+                    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_maxsize)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def get_json(self, path, params=None):
+        response = self.session.get(f"{self.base_url}{path}", params=params, timeout=JIRA_TIMEOUT)
+        if response.status_code != 200:
+            raise JiraError(f"GET {path} failed: {response.status_code}", response.status_code)
+        return response.json()
+
+    def warmup(self):
+        """以 /myself 建立連線並確認帳號可用，回傳 HTTP 狀態碼"""
+        response = self.session.get(f"{self.base_url}/rest/api/2/myself", timeout=JIRA_TIMEOUT)
+        response.close()
+        return response.status_code
+
+    def get_issue_assignee(self, issue_key):
+        """回傳 (assignee 顯示名稱, assignee email)"""
+        data = self.get_json(f"/rest/api/2/issue/{issue_key}", params={'fields': 'assignee'})
+        assignee = (data.get('fields') or {}).get('assignee') or {}
+        return assignee.get('displayName'), assignee.get('emailAddress')
+
+    def get_comments(self, issue_key):
+        data = self.get_json(f"/rest/api/2/issue/{issue_key}/comment")
+        return data.get('comments') or []
+
+    def open_stream(self, url):
+        """以串流方式開啟（例如 filter XML）回應，回傳可讀取的檔案物件"""
+        response = self.session.get(
+            url,
+            stream=True,
+            timeout=JIRA_TIMEOUT,
+            headers={'Accept': 'application/xml', 'Cache-Control': 'no-cache'}
+        )
+        if response.status_code != 200:
+            response.close()
+            raise JiraError(f"GET {url} failed: {response.status_code}", response.status_code)
+        response.raw.decode_content = True
+        return response
+
+
+# 依 (base_url, 帳號, token) 共用的 JiraClient；常駐程式內跨請求重用連線
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(username, token, base_url=JIRA_BASE_URL):
+    """取得共用的 JiraClient（warmup 建立的連線可由之後的搜尋/同步重用）"""
+    key = (base_url.rstrip('/'), username, token)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = JiraClient(username, token, base_url=base_url)
+        return client
+
+
+def iter_filter_items(stream):
+    """以 iterparse 逐一讀出 filter XML 的 <item>，不需要把整份 XML 放進記憶體"""
+    for event, elem in ET.iterparse(stream, events=('end',)):
+        if elem.tag != 'item':
+            continue
+        yield {
+            'key': elem.findtext('key'),
+            'title': elem.findtext('title'),
+            'link': elem.findtext('link')
+        }
+        elem.clear()
+
+
+def parse_jira_time(value):
+    """解析 JIRA 的時間格式，例如 2024-10-21T10:00:00.000+0800"""
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z'):
+        try:
+            return datetime.strptime(value, fmt)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def parse_target_users(target_users):
+    """targetUsers 可以是逗號分隔字串或 list"""
+    if isinstance(target_users, str):
+        target_users = target_users.split(',')
+    return {user.strip() for user in target_users or [] if user and user.strip()}
+
+
+def last_target_comment(comments, target_users):
+    """從最後往前找指定用戶的最後一則評論"""
+    for comment in reversed(comments):
+        if (comment.get('author') or {}).get('key') in target_users:
+            return comment
+    return None
+
+
+def matches_comment_window(comment, comment_hours, now=None):
+    """評論是否在最近 comment_hours 小時內"""
+    created = parse_jira_time(comment.get('created'))
+    if created is None:
+        return False
+    now = now or datetime.now(timezone.utc)
+    return (now - created).total_seconds() <= float(comment_hours) * 3600
+
+
+def build_issue_record(item, assignee, assignee_email, comment):
+    """組成建立聊天流程使用的 issue 資料"""
+    return {
+        'title': item['title'],
+        'link': item['link'],
+        'key': item['key'],
+        'assignee': assignee,
+        'assigneeEmail': assignee_email,
+        'lastComment': {
+            'author': comment['author']['key'],
+            'created': comment.get('created'),
+            'body': (comment.get('body') or '')[:MAX_COMMENT_BODY]
+        }
+    }
+
+
+def _check_item(client, item, target_users, comment_hours, now):
+    """先讀評論；只有符合條件的 issue 才再查詢 assignee"""
+    comment = last_target_comment(client.get_comments(item['key']), target_users)
+    if comment is None or not matches_comment_window(comment, comment_hours, now):
+        return None
+    assignee, assignee_email = client.get_issue_assignee(item['key'])
+    return build_issue_record(item, assignee, assignee_email, comment)
+
+
+def fetch_filtered_issues(xml_url, username, token, target_users, comment_hours,
+                          max_workers=DEFAULT_MAX_WORKERS, base_url=JIRA_BASE_URL):
+    """
+    串流解析 filter XML，同時以有限併發數讀取每個 issue 的評論與 assignee，
+    回傳指定用戶在最近 comment_hours 小時內有評論的 issues（依 XML 順序）。
+    """
+    client = JiraClient(username, token, base_url=base_url, pool_maxsize=max_workers)
+    target_users = parse_target_users(target_users)
+    now = datetime.now(timezone.utc)
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='jira') as executor:
+        response = client.open_stream(xml_url)
+        try:
+            # 邊解析邊送出請求
+            for item in iter_filter_items(response.raw):
+                if item['key']:
+                    futures.append((item, executor.submit(_check_item, client, item, target_users, comment_hours, now)))
+        finally:
+            response.close()
+
+    issues = []
+    for item, future in futures:
+        try:
+            record = future.result()
+        except Exception as e:
+            print(f"Error processing issue {item['key']}: {str(e)}")
+            continue
+        if record:
+            issues.append(record)
+    return issues
+
+
+def filter_jql_from_xml_url(xml_url):
+    """從 filter XML 的 URL（.../searchrequest-xml/59583/...）取得對應的 JQL"""
+    match = re.search(r'searchrequest-xml/(\d+)/', xml_url or '')
+    if not match:
+        return None
+    return f"filter = {match.group(1)}"
+
+
+def window_jql(jql, comment_hours):
+    """有新評論的 issue 其 updated 一定在時間範圍內，以 updated 縮小搜尋範圍"""
+    hours = max(1, int(-(-float(comment_hours) // 1)))
+    return f"({jql}) AND updated >= -{hours}h"
+
+
+def iter_search_issues(client, jql, fields=SEARCH_FIELDS, page_size=SEARCH_PAGE_SIZE):
+    """以 startAt/maxResults 分頁執行 JQL 搜尋，逐筆 yield issue"""
+    start_at = 0
+    while True:
+        data = client.get_json('/rest/api/2/search', params={
+            'jql': jql,
+            'fields': fields,
+            'startAt': start_at,
+            'maxResults': page_size
+        })
+        issues = data.get('issues') or []
+        for issue in issues:
+            yield issue
+        start_at += len(issues)
+        if not issues or start_at >= data.get('total', 0):
+            return
+
+
+def issue_comments(client, issue):
+    """search 回傳的評論清單；被截斷（total 大於筆數）時改讀完整的評論清單"""
+    comment_field = (issue.get('fields') or {}).get('comment') or {}
+    comments = comment_field.get('comments') or []
+    if comment_field.get('total', len(comments)) > len(comments):
+        comments = client.get_comments(issue['key'])
+    return comments
+
+
+def search_filtered_issues(jql, username, token, target_users, comment_hours,
+                           page_size=SEARCH_PAGE_SIZE, base_url=JIRA_BASE_URL):
+    """
+    以一個分頁的 JQL 搜尋同時取得 summary、assignee 與評論，
+    回傳格式與 fetch_filtered_issues 相同。
+    """
+    client = get_client(username, token, base_url=base_url)
+    target_users = parse_target_users(target_users)
+    now = datetime.now(timezone.utc)
+    jql = window_jql(jql, comment_hours)
+
+    issues = []
+    for issue in iter_search_issues(client, jql, page_size=page_size):
+        fields = issue.get('fields') or {}
+        comment = last_target_comment(issue_comments(client, issue), target_users)
+        if comment is None or not matches_comment_window(comment, comment_hours, now):
+            continue
+        assignee = fields.get('assignee') or {}
+        item = {
+            'key': issue['key'],
+            'title': f"[{issue['key']}] {fields.get('summary') or ''}",
+            'link': f"{client.base_url}/browse/{issue['key']}"
+        }
+        issues.append(build_issue_record(
+            item,
+            assignee.get('displayName'),
+            assignee.get('emailAddress'),
+            comment
+        ))
+    return issues
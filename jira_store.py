@@ -0,0 +1,228 @@
+import os
+import sqlite3
+import threading
+import time
+
+from jira_issues import (
+    JIRA_BASE_URL,
+    MAX_COMMENT_BODY,
+    SEARCH_PAGE_SIZE,
+    get_client,
+    issue_comments,
+    iter_search_issues,
+    parse_jira_time,
+    parse_target_users,
+    window_jql
+)
+
+DEFAULT_DB_FILE = os.environ.get(
+    'TEAMS_CHAT_JIRA_DB',
+    os.path.join(os.path.expanduser('~'), '.teams_chat_jira.db')
+)
+
+# 列出 filter 成員時只取 updated，每頁可以多取一些
+LIST_PAGE_SIZE = 1000
+
+# 有變更的 issue 以 key in (...) 一次取回的數量
+FETCH_CHUNK_SIZE = 50
+
+
+def _timestamp(value):
+    parsed = parse_jira_time(value)
+    return parsed.timestamp() if parsed else 0.0
+
+
+class IssueStore:
+    """
+    本機的 JIRA issue/評論快取（SQLite）。
+    評論以 (author_key, created_ts) 建立索引，篩選「指定用戶最近 N 小時的評論」只需一個查詢。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_DB_FILE
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS issues (
+                    issue_key TEXT PRIMARY KEY,
+                    summary TEXT,
+                    assignee TEXT,
+                    assignee_email TEXT,
+                    updated TEXT,
+                    synced_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS comments (
+                    issue_key TEXT NOT NULL,
+                    comment_id TEXT NOT NULL,
+                    author_key TEXT,
+                    created TEXT,
+                    created_ts REAL NOT NULL,
+                    body TEXT,
+                    PRIMARY KEY (issue_key, comment_id)
+                );
+                CREATE INDEX IF NOT EXISTS comments_author_created
+                    ON comments (author_key, created_ts);
+                CREATE TABLE IF NOT EXISTS filter_issues (
+                    jql TEXT NOT NULL,
+                    issue_key TEXT NOT NULL,
+                    PRIMARY KEY (jql, issue_key)
+                );
+            ''')
+
+    def updated_map(self, keys):
+        """回傳已儲存 issue 的 {key: updated}"""
+        keys = list(keys)
+        result = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f'SELECT issue_key, updated FROM issues WHERE issue_key IN ({",".join("?" * len(chunk))})',
+                    chunk
+                ).fetchall()
+                result.update((row['issue_key'], row['updated']) for row in rows)
+        return result
+
+    def save_issue(self, issue, comments):
+        """以 search 結果取代 issue 與其所有評論"""
+        fields = issue.get('fields') or {}
+        assignee = fields.get('assignee') or {}
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?, ?)',
+                (
+                    issue['key'],
+                    fields.get('summary'),
+                    assignee.get('displayName'),
+                    assignee.get('emailAddress'),
+                    fields.get('updated'),
+                    now
+                )
+            )
+            self._conn.execute('DELETE FROM comments WHERE issue_key = ?', (issue['key'],))
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO comments VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (
+                        issue['key'],
+                        str(comment.get('id')),
+                        (comment.get('author') or {}).get('key'),
+                        comment.get('created'),
+                        _timestamp(comment.get('created')),
+                        (comment.get('body') or '')[:MAX_COMMENT_BODY]
+                    )
+                    for comment in comments
+                ]
+            )
+
+    def set_filter_members(self, jql, keys):
+        """記錄目前屬於 filter 的 issues（離開 filter 的 issue 不再被查到）"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM filter_issues WHERE jql = ?', (jql,))
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO filter_issues VALUES (?, ?)',
+                [(jql, key) for key in keys]
+            )
+
+    def query_commented(self, jql, target_users, since_ts, base_url):
+        """
+        回傳 filter 中指定用戶在 since_ts 之後有評論的 issues，
+        格式與 jira_issues.build_issue_record 相同（依最後評論時間新到舊）。
+        """
+        users = sorted(target_users)
+        if not users:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f'''
+                SELECT i.issue_key, i.summary, i.assignee, i.assignee_email,
+                       c.author_key, c.created, c.body, c.created_ts
+                FROM (
+                    SELECT issue_key, MAX(created_ts) AS last_ts
+                    FROM comments
+                    WHERE author_key IN ({",".join("?" * len(users))}) AND created_ts >= ?
+                    GROUP BY issue_key
+                ) AS latest
+                JOIN filter_issues f ON f.jql = ? AND f.issue_key = latest.issue_key
+                JOIN issues i ON i.issue_key = latest.issue_key
+                JOIN comments c ON c.issue_key = latest.issue_key AND c.created_ts = latest.last_ts
+                WHERE c.author_key IN ({",".join("?" * len(users))})
+                ORDER BY c.created_ts DESC
+                ''',
+                users + [since_ts, jql] + users
+            ).fetchall()
+
+        issues = []
+        seen = set()
+        for row in rows:
+            if row['issue_key'] in seen:
+                continue
+            seen.add(row['issue_key'])
+            issues.append({
+                'title': f"[{row['issue_key']}] {row['summary'] or ''}",
+                'link': f"{base_url}/browse/{row['issue_key']}",
+                'key': row['issue_key'],
+                'assignee': row['assignee'],
+                'assigneeEmail': row['assignee_email'],
+                'lastComment': {
+                    'author': row['author_key'],
+                    'created': row['created'],
+                    'body': row['body']
+                }
+            })
+        return issues
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def sync_filter(store, client, jql, comment_hours):
+    """
+    增量同步：先只取 filter 在時間範圍內各 issue 的 updated，
+    再只重新抓取 updated 有變更（或尚未儲存）的 issues。回傳重新抓取的數量。
+    """
+    listed = {
+        issue['key']: (issue.get('fields') or {}).get('updated')
+        for issue in iter_search_issues(client, window_jql(jql, comment_hours), fields='updated',
+                                        page_size=LIST_PAGE_SIZE)
+    }
+    stored = store.updated_map(listed)
+    changed = [key for key, updated in listed.items() if stored.get(key) != updated]
+
+    for i in range(0, len(changed), FETCH_CHUNK_SIZE):
+        chunk = changed[i:i + FETCH_CHUNK_SIZE]
+        chunk_jql = f"key in ({','.join(chunk)})"
+        for issue in iter_search_issues(client, chunk_jql, fields='summary,assignee,comment,updated',
+                                        page_size=SEARCH_PAGE_SIZE):
+            store.save_issue(issue, issue_comments(client, issue))
+
+    store.set_filter_members(jql, listed)
+    return len(changed)
+
+
+def sync_filtered_issues(store, jql, username, token, target_users, comment_hours, base_url=JIRA_BASE_URL):
+    """同步後以索引查詢篩選，回傳格式與 jira_issues.fetch_filtered_issues 相同"""
+    client = get_client(username, token, base_url=base_url)
+    refetched = sync_filter(store, client, jql, comment_hours)
+    print(f"JIRA sync: {refetched} issues refetched")
+    since_ts = time.time() - float(comment_hours) * 3600
+    return store.query_commented(jql, parse_target_users(target_users), since_ts, client.base_url)
+
+
+# 全局 IssueStore
+_issue_store = None
+_issue_store_lock = threading.Lock()
+
+def get_issue_store():
+    """取得全局 IssueStore（daemon 內跨請求共用）"""
+    global _issue_store
+    if _issue_store is None:
+        with _issue_store_lock:
+            if _issue_store is None:
+                _issue_store = IssueStore()
+    return _issue_store
@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+"""
+無介面的 JIRA webhook 服務：接收 JIRA 的評論/issue 事件，
+以與 popup 相同的指定用戶與時間範圍條件篩選，符合的 issue 交給工作執行緒建立 Teams 聊天。
+
+JIRA 端設定 webhook URL 為 http://<host>:<port>/jira-webhook?secret=<TEAMS_CHAT_WEBHOOK_SECRET>，
+事件選擇 Comment created / Issue created / Issue updated。
+
+用法: python jira_webhook_service.py --owner owner@example.com --members a@example.com,b@example.com
+                                     [--target-users JIRAUSER50632] [--comment-hours 18] [--port 8780]
+"""
+import argparse
+import hmac
+import json
+import logging
+import os
+import signal
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from chat_jobs import build_chat_job
+from jira_issues import (
+    JIRA_BASE_URL,
+    build_issue_record,
+    get_client,
+    last_target_comment,
+    matches_comment_window,
+    parse_target_users
+)
+
+# 服務監聽的埠號
+WEBHOOK_PORT = int(os.environ.get('TEAMS_CHAT_WEBHOOK_PORT', '8780'))
+
+# webhook URL 中 secret 參數（或 X-Webhook-Secret header）必須相符；未設定時不檢查
+WEBHOOK_SECRET = os.environ.get('TEAMS_CHAT_WEBHOOK_SECRET', '')
+
+# webhook 請求內容的大小上限
+MAX_BODY_SIZE = 5 * 1024 * 1024
+
+WEBHOOK_PATH = '/jira-webhook'
+
+# 會處理的事件；其他事件（刪除、worklog 等）直接忽略
+HANDLED_EVENTS = ('comment_created', 'comment_updated', 'jira:issue_created', 'jira:issue_updated')
+
+
+class WebhookService:
+    """篩選 webhook 事件並以有限的工作執行緒建立聊天"""
+
+    def __init__(self, owner_email, member_emails, target_users, comment_hours=18,
+                 max_workers=None, jira_client=None, base_url=JIRA_BASE_URL):
+        from create_teams_chat import DEFAULT_CONCURRENCY
+
+        self.owner_email = owner_email
+        self.member_emails = list(member_emails)
+        self.target_users = parse_target_users(target_users)
+        self.comment_hours = comment_hours
+        self.jira_client = jira_client
+        self.base_url = base_url.rstrip('/')
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or DEFAULT_CONCURRENCY,
+            thread_name_prefix='webhook'
+        )
+        self.counts = Counter()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def _issue_fields(self, issue):
+        """webhook 的 issue 不一定帶有 summary/assignee（例如 comment_created），必要時向 JIRA 查詢"""
+        fields = issue.get('fields') or {}
+        if 'summary' in fields and 'assignee' in fields:
+            return fields
+        if self.jira_client is None:
+            return fields
+        data = self.jira_client.get_json(
+            f"/rest/api/2/issue/{issue['key']}",
+            params={'fields': 'summary,assignee'}
+        )
+        return dict(fields, **(data.get('fields') or {}))
+
+    def match_event(self, event):
+        """
+        依指定用戶與時間範圍篩選事件。
+        回傳 (issue 資料, None)；不符合時回傳 (None, 原因)。
+        """
+        if event.get('webhookEvent') not in HANDLED_EVENTS:
+            return None, f"ignored event {event.get('webhookEvent')}"
+        issue = event.get('issue') or {}
+        if not issue.get('key'):
+            return None, 'no issue in event'
+
+        # 評論事件帶有該則評論；issue 事件則看 issue 上的評論清單
+        if event.get('comment'):
+            comments = [event['comment']]
+        else:
+            comments = ((issue.get('fields') or {}).get('comment') or {}).get('comments') or []
+        comment = last_target_comment(comments, self.target_users)
+        if comment is None:
+            return None, 'no comment from target users'
+        if not matches_comment_window(comment, self.comment_hours):
+            return None, 'comment outside the time window'
+
+        fields = self._issue_fields(issue)
+        assignee = fields.get('assignee') or {}
+        item = {
+            'key': issue['key'],
+            'title': f"[{issue['key']}] {fields.get('summary') or ''}",
+            'link': f"{self.base_url}/browse/{issue['key']}"
+        }
+        return build_issue_record(
+            item,
+            assignee.get('displayName'),
+            assignee.get('emailAddress'),
+            comment
+        ), None
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def handle_event(self, event):
+        """篩選事件，符合時排入工作執行緒；回傳給 JIRA 的回應內容"""
+        self._count('received')
+        try:
+            issue, reason = self.match_event(event)
+        except Exception as e:
+            logging.error(f"Error reading webhook event: {str(e)}")
+            self._count('errors')
+            return {'accepted': False, 'reason': str(e)}
+        if issue is None:
+            self._count('filtered')
+            return {'accepted': False, 'reason': reason}
+
+        with self._lock:
+            # JIRA 常對同一動作送出多個事件；同一 issue 同時只處理一次，完成後由 ChatStore 直接重用
+            if issue['key'] in self._in_flight:
+                self.counts['duplicates'] += 1
+                return {'accepted': False, 'key': issue['key'], 'reason': 'already queued'}
+            self._in_flight.add(issue['key'])
+            self.counts['queued'] += 1
+        job = build_chat_job(issue, self.owner_email, self.member_emails)
+        self.executor.submit(self._create_chat, issue['key'], job)
+        return {'accepted': True, 'key': issue['key']}
+
+    def _create_chat(self, issue_key, job):
+        import create_teams_chat
+        try:
+            # 經過持久化佇列：服務中斷時，下次啟動由 resume_interrupted_jobs 接手
+            result = create_teams_chat.create_chats_concurrently([job], max_workers=1)[0]
+            if result and result.get('timedOut'):
+                outcome = 'timedOut'
+            elif result:
+                outcome = 'reused' if result.get('reused') else 'created'
+            else:
+                outcome = 'failed'
+            logging.info(f"Webhook chat for {issue_key}: {outcome} {(result or {}).get('id', '')}")
+        except Exception as e:
+            logging.error(f"Error creating chat for {issue_key}: {str(e)}")
+            outcome = 'failed'
+        with self._lock:
+            self.counts[outcome] += 1
+            self._in_flight.discard(issue_key)
+            self._idle.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """等待所有排入的聊天建立完成（測試與量測使用）；逾時回傳 False"""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._in_flight, timeout)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, inFlight=len(self._in_flight))
+
+    def close(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _authorized(self, query):
+        secret = self.server.secret
+        if not secret:
+            return True
+        supplied = self.headers.get('X-Webhook-Secret') or (query.get('secret') or [''])[0]
+        return hmac.compare_digest(supplied.encode('utf-8'), secret.encode('utf-8'))
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/health':
+            self._send_json(200, {'success': True, 'result': self.server.service.stats()})
+        else:
+            self._send_json(404, {'success': False, 'message': 'Not found'})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != WEBHOOK_PATH:
+            self._send_json(404, {'success': False, 'message': 'Not found'})
+            return
+        if not self._authorized(parse_qs(url.query)):
+            self._send_json(403, {'success': False, 'message': 'Invalid webhook secret'})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            self._send_json(413, {'success': False, 'message': 'Payload too large'})
+            return
+        try:
+            event = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'success': False, 'message': 'Invalid JSON'})
+            return
+        # 建立聊天在工作執行緒進行，JIRA 不必等待
+        response = self.server.service.handle_event(event)
+        self._send_json(202 if response['accepted'] else 200, dict(response, success=True))
+
+
+class WebhookServer:
+    """在背景執行緒啟動 webhook HTTP 服務；url 為 webhook 的完整位址"""
+
+    def __init__(self, service, host='127.0.0.1', port=WEBHOOK_PORT, secret=WEBHOOK_SECRET):
+        self.service = service
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.service = service
+        self.httpd.secret = secret
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}{WEBHOOK_PATH}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _resume_jobs():
+    """啟動時接手前一個服務程序（或 host）結束時未完成的 job"""
+    import create_teams_chat
+    try:
+        resumed = create_teams_chat.resume_interrupted_jobs()
+        if resumed:
+            logging.info(f'Resumed {len(resumed)} interrupted chat jobs')
+    except Exception as e:
+        logging.warning(f'Resuming jobs failed: {str(e)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create Teams chats from JIRA webhook events')
+    parser.add_argument('--owner', default=os.environ.get('TEAMS_CHAT_OWNER_EMAIL'), help='Teams owner email')
+    parser.add_argument('--members', default=os.environ.get('TEAMS_CHAT_MEMBER_EMAILS', ''),
+                        help='comma separated member emails')
+    parser.add_argument('--target-users', default='JIRAUSER50632,JIRAUSER51966')
+    parser.add_argument('--comment-hours', type=float, default=18)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=WEBHOOK_PORT)
+    parser.add_argument('--concurrency', type=int, default=None)
+    parser.add_argument('--jira-url', default=JIRA_BASE_URL)
+    args = parser.parse_args()
+
+    members = [email.strip() for email in args.members.split(',') if email.strip()]
+    if not args.owner or not members:
+        parser.error('--owner and --members (or TEAMS_CHAT_OWNER_EMAIL / TEAMS_CHAT_MEMBER_EMAILS) are required')
+
+    logging.basicConfig(
+        level=os.environ.get('TEAMS_CHAT_LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    # 事件沒有 summary/assignee 時向 JIRA 查詢
+    jira_username = os.environ.get('TEAMS_CHAT_JIRA_USERNAME')
+    jira_token = os.environ.get('TEAMS_CHAT_JIRA_TOKEN')
+    jira_client = get_client(jira_username, jira_token, args.jira_url) if jira_username and jira_token else None
+
+    service = WebhookService(
+        args.owner,
+        members,
+        args.target_users,
+        args.comment_hours,
+        max_workers=args.concurrency,
+        jira_client=jira_client,
+        base_url=args.jira_url
+    )
+    server = WebhookServer(service, args.host, args.port)
+    logging.info(f'Listening for JIRA webhooks on {server.url}')
+    threading.Thread(target=_resume_jobs, daemon=True).start()
+
+    # 收到 SIGTERM 時停止接收事件，等待進行中的聊天建立完成
+    signal.signal(
+        signal.SIGTERM,
+        lambda signum, frame: threading.Thread(target=server.httpd.shutdown, daemon=True).start()
+    )
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        service.close()
+        logging.info(f'Webhook service stopped: {service.stats()}')
+
+
+if __name__ == '__main__':
+    main()
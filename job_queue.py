@@ -0,0 +1,221 @@
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from chat_store import DEFAULT_DB_FILE
+
+# job 的租約秒數：批次執行期間每 min(JOB_LEASE / 3, 60) 秒續約一次，租約過期表示執行它的程序已中斷。
+# 擁有者程序已結束的 job 不必等租約過期，可立即接手
+JOB_LEASE = float(os.environ.get('TEAMS_CHAT_JOB_LEASE', '180'))
+
+# 已完成的 job 保留天數
+DONE_RETENTION = 7 * 24 * 3600
+
+# 此程序中尚未關閉的 JobQueue 的識別
+_live_owners = set()
+
+
+def _process_alive(pid):
+    """pid 的程序是否仍在執行；無法判斷時視為仍在執行（等租約過期）"""
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        # PROCESS_QUERY_LIMITED_INFORMATION
+        handle = kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            # ERROR_INVALID_PARAMETER：沒有這個程序
+            return kernel32.GetLastError() != 87
+        try:
+            exit_code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+                return True
+            # STILL_ACTIVE
+            return exit_code.value == 259
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _owner_alive(owner):
+    """擁有者（'<pid>-<queue id>-<batch>'）的 JobQueue 是否可能仍在執行"""
+    if not owner:
+        return False
+    pid, _, rest = owner.partition('-')
+    if not pid.isdigit():
+        return True
+    if int(pid) == os.getpid():
+        return f'{pid}-{rest.split("-")[0]}' in _live_owners
+    return _process_alive(int(pid))
+
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueue:
+    """
+    建立聊天的持久化工作佇列（與 ChatStore 使用同一個 SQLite 檔）。
+    每個 issue 一個 job；程序中斷後，擁有者已結束或租約過期的 pending/running job 可由其他程序接手，
+    各步驟（建立、加入成員、連結、釘選、問候）的進度記錄在 ChatStore，接手時只補做未完成的步驟。
+    job 的擁有者是一個批次（batch_owner()），同一程序中的其他批次（例如 resumeJobs）
+    也不能接手租約仍有效的 job。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_DB_FILE
+        # 區分不同程序（以及同一程序重新啟動）的識別，批次的擁有者以此為前綴
+        self.owner = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._batches = itertools.count(1)
+        _live_owners.add(self.owner)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    issue_key TEXT,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    owner TEXT,
+                    lease_until REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until)')
+
+    def batch_owner(self):
+        """新批次的擁有者識別"""
+        return f'{self.owner}-{next(self._batches)}'
+
+    def enqueue(self, chat_jobs, owner):
+        """以 owner 的名義加入一批 job（create_teams_chat.main 的參數），回傳 job id 清單"""
+        now = time.time()
+        job_ids = []
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM jobs WHERE status = ? AND updated_at < ?',
+                (DONE, now - DONE_RETENTION)
+            )
+            for job in chat_jobs:
+                cursor = self._conn.execute(
+                    '''
+                    INSERT INTO jobs (issue_key, params, status, owner, lease_until, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''',
+                    (job.get('issue_key'), json.dumps(job), PENDING, owner, now + JOB_LEASE, now, now)
+                )
+                job_ids.append(cursor.lastrowid)
+        return job_ids
+
+    def start(self, job_id, owner):
+        """
+        開始執行 job 並更新租約。
+        只有擁有者能開始自己 pending 的 job；租約過期的 job 任何人都能接手。
+        job 已完成、已在執行，或由其他批次擁有（租約未過期）時回傳 False。
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                '''
+                UPDATE jobs SET status = ?, owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?
+                WHERE job_id = ? AND status IN (?, ?)
+                  AND ((owner = ? AND status = ?) OR lease_until < ?)
+                ''',
+                (RUNNING, owner, now + JOB_LEASE, now, job_id, PENDING, RUNNING, owner, PENDING, now)
+            )
+            return cursor.rowcount == 1
+
+    def renew(self, job_ids, owner):
+        """延長 owner 尚未完成的 job 的租約（批次執行期間定期呼叫）"""
+        if not job_ids:
+            return
+        now = time.time()
+        placeholders = ','.join('?' * len(job_ids))
+        with self._lock, self._conn:
+            self._conn.execute(
+                f'''
+                UPDATE jobs SET lease_until = ?
+                WHERE job_id IN ({placeholders}) AND owner = ? AND status IN (?, ?)
+                ''',
+                (now + JOB_LEASE, *job_ids, owner, PENDING, RUNNING)
+            )
+
+    def finish(self, job_id, owner, success, error=None):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ? AND owner = ?',
+                (DONE if success else FAILED, error, now, job_id, owner)
+            )
+
+    def release(self, job_id, owner, error=None):
+        """放棄執行中的 job（例如超過時間預算），讓之後的 resume 立即接手"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                '''
+                UPDATE jobs SET status = ?, owner = NULL, error = ?, lease_until = 0, updated_at = ?
+                WHERE job_id = ? AND owner = ?
+                ''',
+                (PENDING, error, now, job_id, owner)
+            )
+
+    def claim_interrupted(self, owner):
+        """
+        接手中斷、尚未完成的 job：擁有者程序已結束、租約已過期，或批次放棄的 job。
+        回傳 [(job_id, params)]，這些 job 的擁有者改為 owner。
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                'SELECT job_id, params, owner, lease_until FROM jobs WHERE status IN (?, ?) ORDER BY job_id',
+                (PENDING, RUNNING)
+            ).fetchall()
+            alive = {}
+            claimed = []
+            for row in rows:
+                if row['lease_until'] >= now:
+                    if row['owner'] not in alive:
+                        alive[row['owner']] = _owner_alive(row['owner'])
+                    if alive[row['owner']]:
+                        continue
+                # 只在讀取後沒有被其他程序接手或續約時才接手
+                cursor = self._conn.execute(
+                    '''
+                    UPDATE jobs SET status = ?, owner = ?, lease_until = ?, updated_at = ?
+                    WHERE job_id = ? AND status IN (?, ?) AND owner IS ? AND lease_until = ?
+                    ''',
+                    (PENDING, owner, now + JOB_LEASE, now, row['job_id'], PENDING, RUNNING,
+                     row['owner'], row['lease_until'])
+                )
+                if cursor.rowcount == 1:
+                    claimed.append((row['job_id'], json.loads(row['params'])))
+        return claimed
+
+    def counts(self):
+        """各狀態的 job 數量"""
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def close(self):
+        _live_owners.discard(self.owner)
+        with self._lock:
+            self._conn.close()
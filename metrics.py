@@ -0,0 +1,134 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# 每個聊天一行的 JSONL trace；設為 off 時停用
+TRACE_FILE = os.environ.get(
+    'TEAMS_CHAT_TRACE_FILE',
+    os.path.join(os.path.expanduser('~'), '.teams_chat_trace.jsonl')
+)
+
+# trace 檔超過此大小時輪替為 .1
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+
+# 每個 histogram 保留的最近樣本數
+MAX_SAMPLES = 10000
+
+
+def percentile(sorted_values, q):
+    """nearest-rank 百分位數；sorted_values 需已排序"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Histogram:
+    """保留最近 MAX_SAMPLES 個樣本（毫秒），報表時再計算百分位數"""
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def snapshot(self):
+        values = sorted(self.samples)
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count, 2) if self.count else None,
+            'p50_ms': percentile(values, 50),
+            'p95_ms': percentile(values, 95),
+            'p99_ms': percentile(values, 99),
+            'max_ms': self.max
+        }
+
+
+class Metrics:
+    """
+    程序內的延遲統計。
+    span() 記錄到依名稱分類的 histogram；在 trace() 之內的 span 另外寫入 JSONL trace 檔。
+    """
+
+    def __init__(self, trace_file=TRACE_FILE):
+        self.trace_file = None if str(trace_file).lower() in ('', 'off', 'none') else trace_file
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._trace_lock = threading.Lock()
+        self._local = threading.local()
+
+    def record(self, name, elapsed_ms, **attrs):
+        elapsed_ms = round(elapsed_ms, 2)
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(elapsed_ms)
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            span = {'name': name, 'ms': elapsed_ms}
+            span.update(attrs)
+            trace['spans'].append(span)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """計時一段程式；可在 with 區塊內對 yield 的 dict 加上屬性（例如 status）"""
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000, **attrs)
+
+    @contextmanager
+    def trace(self, **attrs):
+        """收集這個執行緒在區塊內的所有 span，結束時寫入一行 trace"""
+        start = time.perf_counter()
+        trace = {'ts': time.time(), 'spans': []}
+        trace.update(attrs)
+        previous = getattr(self._local, 'trace', None)
+        self._local.trace = trace
+        try:
+            yield trace
+        finally:
+            self._local.trace = previous
+            trace['total_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            self._write_trace(trace)
+
+    def _write_trace(self, trace):
+        if not self.trace_file:
+            return
+        try:
+            line = json.dumps(trace, default=str) + '\n'
+            with self._trace_lock:
+                try:
+                    if os.path.getsize(self.trace_file) > TRACE_MAX_BYTES:
+                        os.replace(self.trace_file, self.trace_file + '.1')
+                except OSError:
+                    pass
+                with open(self.trace_file, 'a', encoding='utf-8') as f:
+                    f.write(line)
+        except Exception as e:
+            print(f"Error writing trace: {e}")
+
+    def snapshot(self):
+        """回傳 {span 名稱: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}}"""
+        with self._lock:
+            return {name: histogram.snapshot() for name, histogram in sorted(self._histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+# 全局統計
+metrics = Metrics()
@@ -0,0 +1,164 @@
+import random
+import threading
+import time
+
+# 需要重試的狀態碼（節流或服務暫時無法使用）
+RETRYABLE_STATUS = (429, 503, 504)
+
+# 重送不會造成重複效果的方法
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+# 各類端點的初始速率（每秒請求數）
+DEFAULT_RATES = {
+    "chats": 4.0,
+    "members": 10.0,
+    "messages": 5.0,
+    "batch": 2.0,
+    "default": 10.0
+}
+
+
+def endpoint_class(method, url):
+    """依 URL 判斷端點類別，每個類別有獨立的 token bucket"""
+    path = url.split("?", 1)[0]
+    if path.endswith("/$batch"):
+        return "batch"
+    if "/messages" in path:
+        return "messages"
+    if "/members" in path:
+        return "members"
+    if path.rstrip("/").endswith("/chats") and method.upper() == "POST":
+        return "chats"
+    return "default"
+
+
+def is_retryable(method, status_code, retry_after=None):
+    """
+    請求是否可以重送；retry_after 是回應的 Retry-After header（原始值）。
+    冪等方法遇到 429/503/504 都重試。POST（建立聊天、發送消息）收到 504 時可能已經寫入，
+    只在 429 或帶 Retry-After 的 503（請求確定未被處理）時重試。
+    """
+    if status_code not in RETRYABLE_STATUS:
+        return False
+    if method.upper() in IDEMPOTENT_METHODS:
+        return True
+    return status_code == 429 or (status_code == 503 and retry_after is not None)
+
+
+def parse_retry_after(value):
+    """解析 Retry-After（秒數或 HTTP 日期），無法解析時回傳 None"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """指數退避加上 full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    可調整速率的 token bucket。
+    被節流時速率減半並暫停到 Retry-After 為止，連續成功時緩慢提高速率（AIMD）。
+    """
+
+    def __init__(self, rate, min_rate=None, max_rate=None):
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 8
+        self.max_rate = max_rate or rate * 2
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, max_wait=None):
+        """
+        取得一個 token，必要時等待；回傳等待的秒數。
+        需要等待超過 max_wait 秒時不取得 token，回傳 None。
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            if max_wait is not None and waited + wait > max_wait:
+                return None
+            time.sleep(wait)
+            waited += wait
+
+    def on_success(self):
+        """成功時加法增加速率"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.base_rate * 0.05)
+
+    def on_throttle(self, retry_after=None):
+        """被節流時乘法降低速率，並暫停到 Retry-After"""
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": round(self.rate, 2),
+                "throttled": self.throttled
+            }
+
+
+class RateLimiter:
+    """所有 Graph 呼叫共用的速率限制器，每個端點類別一個 token bucket"""
+
+    def __init__(self, rates=None, max_retries=5):
+        self.rates = dict(DEFAULT_RATES)
+        self.rates.update(rates or {})
+        self.max_retries = max_retries
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, name):
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                bucket = TokenBucket(self.rates.get(name, self.rates["default"]))
+                self._buckets[name] = bucket
+            return bucket
+
+    def retry_delay(self, attempt, retry_after=None):
+        """計算重試前的等待時間：優先使用 Retry-After，否則使用退避"""
+        if retry_after is not None:
+            # 加上少量 jitter 避免多個執行緒同時重試
+            return retry_after + random.uniform(0, 0.5)
+        return backoff_delay(attempt)
+
+    def stats(self):
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {name: bucket.stats() for name, bucket in buckets.items()}
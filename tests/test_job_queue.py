@@ -0,0 +1,167 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+sys.path.insert(0, os.path.join(root_dir, 'bench'))
+
+# 租約設得很短，讓批次執行時間超過租約（必須在載入 job_queue 之前設定）
+_work_dir = tempfile.mkdtemp()
+os.environ.update({
+    'TEAMS_CHAT_JOB_LEASE': '1',
+    'TEAMS_CHAT_ACCESS_TOKEN': 'mock-token',
+    'TEAMS_CHAT_STATE_DB': os.path.join(_work_dir, 'state.db'),
+    'TEAMS_CHAT_USER_CACHE': os.path.join(_work_dir, 'users.json'),
+    'TEAMS_CHAT_TRACE_FILE': 'off'
+})
+
+from mock_graph import MockGraphServer
+
+_server = MockGraphServer(latency=0.05, retry_after=0, seed=1).start()
+os.environ['TEAMS_CHAT_GRAPH_ROOT'] = _server.url
+
+import create_teams_chat
+from job_queue import JobQueue
+
+
+class JobQueueLeaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = JobQueue(os.path.join(tempfile.mkdtemp(), 'jobs.db'))
+
+    def tearDown(self):
+        self.queue.close()
+
+    def test_renewed_pending_job_is_not_claimed(self):
+        owner = self.queue.batch_owner()
+        job_id, = self.queue.enqueue([{'issue_key': 'A-1'}], owner)
+        time.sleep(1.1)
+        self.queue.renew([job_id], owner)
+
+        other = self.queue.batch_owner()
+        self.assertEqual(self.queue.claim_interrupted(other), [])
+        self.assertFalse(self.queue.start(job_id, other))
+        self.assertTrue(self.queue.start(job_id, owner))
+
+    def test_start_runs_a_job_only_once(self):
+        owner = self.queue.batch_owner()
+        job_id, = self.queue.enqueue([{'issue_key': 'A-1'}], owner)
+        self.assertTrue(self.queue.start(job_id, owner))
+        self.assertFalse(self.queue.start(job_id, owner))
+
+    def test_claimed_job_cannot_be_started_by_previous_owner(self):
+        owner = self.queue.batch_owner()
+        job_id, = self.queue.enqueue([{'issue_key': 'A-1'}], owner)
+        time.sleep(1.1)
+
+        other = self.queue.batch_owner()
+        self.assertEqual([job for job, _ in self.queue.claim_interrupted(other)], [job_id])
+        self.assertFalse(self.queue.start(job_id, owner))
+        self.assertTrue(self.queue.start(job_id, other))
+
+    def test_released_job_is_claimed_immediately(self):
+        owner = self.queue.batch_owner()
+        job_id, = self.queue.enqueue([{'issue_key': 'A-1'}], owner)
+        self.queue.start(job_id, owner)
+        self.queue.release(job_id, owner, 'timed out')
+        self.queue.renew([job_id], owner)
+        self.assertEqual(len(self.queue.claim_interrupted(self.queue.batch_owner())), 1)
+
+    def test_jobs_of_a_closed_queue_are_claimed_before_lease_expires(self):
+        owner = self.queue.batch_owner()
+        job_ids = self.queue.enqueue([{'issue_key': 'A-1'}, {'issue_key': 'A-2'}, {'issue_key': 'A-3'}], owner)
+        self.queue.start(job_ids[0], owner)
+        self.queue.finish(job_ids[0], owner, True)
+        self.queue.start(job_ids[1], owner)
+        self.queue.close()
+
+        self.queue = JobQueue(self.queue.path)
+        claimed = self.queue.claim_interrupted(self.queue.batch_owner())
+        self.assertEqual([job for job, _ in claimed], job_ids[1:])
+
+
+# 在另一個程序中開始一批 job，執行到一半時結束程序（租約仍有效）
+_ABANDON_SCRIPT = '''
+import os, sys
+sys.path.insert(0, sys.argv[1])
+from job_queue import JobQueue
+queue = JobQueue()
+owner = queue.batch_owner()
+job_ids = queue.enqueue([
+    {
+        'chat_name': f'Abandoned {i}',
+        'owner_email': 'owner@example.com',
+        'member_emails': ['member@example.com'],
+        'issue_link': f'https://jira.example.com/browse/GONE-{i}',
+        'issue_key': f'GONE-{i}',
+        'issue_title': f'[GONE-{i}] Abandoned batch',
+        'assignee': 'Assignee',
+        'assignee_email': 'assignee@example.com'
+    }
+    for i in range(3)
+], owner)
+queue.start(job_ids[0], owner)
+os._exit(1)
+'''
+
+
+class ResumeAbandonedBatchTest(unittest.TestCase):
+
+    def test_jobs_of_a_dead_process_are_resumed_immediately(self):
+        env = dict(os.environ, TEAMS_CHAT_JOB_LEASE='3600')
+        subprocess.run([sys.executable, '-c', _ABANDON_SCRIPT, root_dir], env=env, timeout=60)
+
+        resumed = create_teams_chat.resume_interrupted_jobs(max_workers=2)
+
+        self.assertEqual(sorted(params['issue_key'] for params, _ in resumed), ['GONE-0', 'GONE-1', 'GONE-2'])
+        self.assertTrue(all(create_teams_chat.chat_succeeded(result) for _, result in resumed))
+        self.assertEqual(create_teams_chat.resume_interrupted_jobs(), [])
+
+
+class ResumeDuringBatchTest(unittest.TestCase):
+
+    def test_resume_does_not_duplicate_jobs_of_a_running_batch(self):
+        """批次執行時間超過租約時，同一程序的 resumeJobs 不能再執行排隊中的 job"""
+        issues = 16
+        chat_jobs = [
+            {
+                'chat_name': f'Lease {i}',
+                'owner_email': 'owner@example.com',
+                'member_emails': ['member@example.com', f'assignee{i}@example.com'],
+                'issue_link': f'https://jira.example.com/browse/LEASE-{i}',
+                'issue_key': f'LEASE-{i}',
+                'issue_title': f'[LEASE-{i}] Lease test',
+                'assignee': f'Assignee {i}',
+                'assignee_email': f'assignee{i}@example.com'
+            }
+            for i in range(issues)
+        ]
+        chats_before = len(_server.graph.chats)
+
+        stop = threading.Event()
+        resumed = []
+
+        def keep_resuming():
+            while not stop.wait(0.2):
+                resumed.extend(create_teams_chat.resume_interrupted_jobs(max_workers=2))
+
+        resumer = threading.Thread(target=keep_resuming)
+        resumer.start()
+        try:
+            results = create_teams_chat.create_chats_concurrently(chat_jobs, max_workers=2)
+        finally:
+            stop.set()
+            resumer.join()
+
+        self.assertEqual(resumed, [])
+        self.assertTrue(all(create_teams_chat.chat_succeeded(result) for result in results))
+        self.assertEqual(len(_server.graph.chats) - chats_before, issues)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import threading
+
+from msal import SerializableTokenCache
+
+from file_lock import FileLock, atomic_write_text
+
+
+class LockedTokenCache(SerializableTokenCache):
+    """
+    以檔案保存、可在多個程序間共用的 MSAL token 快取。
+    寫入時持有檔案鎖，先重新載入其他程序的變更再寫回（write-then-rename）；
+    讀取時只在檔案的 mtime/size 改變時才重新解析。
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._file_lock = FileLock(path)
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._last_stat = None
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def reload_if_changed(self):
+        """檔案自上次載入後有變更時才重新解析"""
+        stat = self._file_stat()
+        if stat is None or stat == self._last_stat:
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = f.read()
+        if data.strip():
+            self.deserialize(data)
+        self._last_stat = stat
+        return True
+
+    def _save(self):
+        atomic_write_text(self.path, self.serialize())
+        self._last_stat = self._file_stat()
+        self.has_state_changed = False
+
+    def flush(self):
+        """仍有未寫入的變更時寫回檔案"""
+        with self._thread_lock:
+            if self.has_state_changed:
+                with self._file_lock:
+                    self._save()
+
+    def _locked_update(self, update):
+        """在檔案鎖內：重新載入 -> 修改 -> 寫回；巢狀呼叫只修改記憶體"""
+        with self._thread_lock:
+            if self._depth:
+                return update()
+            self._depth += 1
+            try:
+                with self._file_lock:
+                    self.reload_if_changed()
+                    result = update()
+                    if self.has_state_changed:
+                        self._save()
+                    return result
+            finally:
+                self._depth -= 1
+
+    def add(self, event, **kwargs):
+        return self._locked_update(lambda: super(LockedTokenCache, self).add(event, **kwargs))
+
+    def modify(self, credential_type, old_entry, new_key_value_pairs=None):
+        return self._locked_update(
+            lambda: super(LockedTokenCache, self).modify(
+                credential_type,
+                old_entry,
+                new_key_value_pairs=new_key_value_pairs
+            )
+        )
+
+    def search(self, *args, **kwargs):
+        self._reload_quietly()
+        return super().search(*args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        self._reload_quietly()
+        return super().find(*args, **kwargs)
+
+    def _reload_quietly(self):
+        with self._thread_lock:
+            if self._depth:
+                return
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                # 讀取失敗時沿用記憶體中的快取
+                print(f"Error reloading token cache: {e}")
@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from file_lock import FileLock, atomic_write_text
+
+DEFAULT_CACHE_FILE = os.environ.get(
+    'TEAMS_CHAT_USER_CACHE',
+    os.path.join(os.path.expanduser('~'), '.teams_chat_users.json')
+)
+
+# 有效的 email -> ID 對應保留 7 天，不存在的使用者保留 1 天
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+
+# 快取中代表「使用者不存在」的值
+NOT_FOUND = ''
+
+
+class UserIdCache:
+    """
+    email -> AAD 物件 ID 的 LRU 快取，每筆資料有存活時間並保存到磁碟。
+    不存在的使用者也會快取（較短的存活時間），避免重複查詢。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """從磁碟載入快取（忽略已過期的資料）"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Error loading user cache: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for email, (user_id, expires_at) in data.items():
+                if expires_at > now and email not in self._entries:
+                    self._entries[email] = (user_id, expires_at)
+            self._trim()
+
+    def get(self, email):
+        """
+        回傳 (hit, user_id)。
+        hit=False 表示需要查詢；hit=True 且 user_id 為 None 表示使用者不存在。
+        """
+        key = email.lower()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            user_id, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, (user_id or None)
+
+    def put(self, email, user_id):
+        """記錄查詢結果；user_id 為 None 表示使用者不存在"""
+        ttl = self.ttl if user_id else self.negative_ttl
+        with self._lock:
+            key = email.lower()
+            self._entries[key] = (user_id or NOT_FOUND, time.time() + ttl)
+            self._entries.move_to_end(key)
+            self._trim()
+            self._dirty = True
+
+    def _trim(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        """有變更時寫回磁碟，並合併其他程序寫入的資料"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+        try:
+            with FileLock(self.path):
+                self.load()
+                now = time.time()
+                with self._lock:
+                    data = {
+                        email: [user_id, expires_at]
+                        for email, (user_id, expires_at) in self._entries.items()
+                        if expires_at > now
+                    }
+                atomic_write_text(self.path, json.dumps(data))
+        except Exception as e:
+            print(f"Error saving user cache: {e}")